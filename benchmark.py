@@ -0,0 +1,667 @@
+import argparse
+import base64
+from datetime import datetime, timezone
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from config import AUTO_KEY_ID
+from core import shift
+from core.cipher_cache import CipherCache
+from core.compression import COMPRESSION_PROFILES
+from core.decrypter import DBDDecrypter
+from core.document import JsonDocument
+from core.encrypter import DBDEncrypter
+from utils import KeyRing
+
+MEGABYTE = 1024 * 1024
+
+BENCHMARK_KEY_ID = "9.5.0_live"
+
+CORE_MODULES = ("core.decrypter", "core.encrypter")
+CORE_IMPORT_BUDGET_MS = 100
+CORE_FORBIDDEN_IMPORTS = ("PyQt6", "requests", "Crypto", "numpy")
+
+SUITE_SIZES = ("1KB", "100KB", "1MB", "10MB", "100MB")
+SUITE_MIN_TIME = 0.2
+SUITE_RESULTS_PATH = "benchmark_results.json"
+SUITE_TOLERANCE = 0.10
+SIZE_UNITS = {"KB": 1024, "MB": MEGABYTE}
+
+# ==================
+# Helpers
+# ==================
+
+
+def measure_throughput(function, data, repeat):
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        function(data)
+
+    elapsed = time.perf_counter() - start
+    return len(data) * repeat / MEGABYTE / elapsed
+
+
+def print_row(name, throughput):
+    print(f"{name:<24}{throughput:>12.1f} MB/s")
+
+
+def generate_access_keys():
+    return KeyRing(
+        {BENCHMARK_KEY_ID: base64.b64encode(os.urandom(32)).decode("ascii")}
+    )
+
+
+def generate_document(size):
+    entry = {"id": 0, "name": "benchmark", "values": list(range(16))}
+    entry_length = len(json.dumps(entry)) + 2
+    return json.dumps([dict(entry, id=index) for index in range(size // entry_length)])
+
+
+def generate_incompressible_document(size):
+    chunk_length = 4096
+    return json.dumps(
+        [
+            base64.b64encode(os.urandom(chunk_length * 3 // 4)).decode("ascii")
+            for _ in range(max(1, size // chunk_length))
+        ]
+    )
+
+
+class NullWriter:
+    def write(self, text):
+        return len(text)
+
+
+def measure_peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def parse_size(value):
+    """
+    Parse a size such as "512", "64KB" or "10MB" into bytes.
+    """
+    for unit, multiplier in SIZE_UNITS.items():
+        if value.upper().endswith(unit):
+            return int(value[: -len(unit)]) * multiplier
+    return int(value)
+
+
+def format_size(size):
+    for unit, multiplier in reversed(SIZE_UNITS.items()):
+        if size >= multiplier and size % multiplier == 0:
+            return f"{size // multiplier}{unit}"
+    return f"{size}B"
+
+
+# ==================
+# Byte Shift
+# ==================
+
+
+def legacy_shift_up_until_terminator(data):
+    result_bytes = bytearray()
+
+    for byte in data:
+        if byte == 0:
+            break
+        result_bytes.append((byte + 1) % 256)
+
+    return bytes(result_bytes)
+
+
+def legacy_shift_down(data):
+    return bytes((byte - 1) % 256 for byte in data)
+
+
+def bench_shift(args):
+    data = os.urandom(args.size * MEGABYTE).replace(b"\x00", b"\x01")
+    print(f"Byte shift, {args.size} MB payload")
+
+    print_row("legacy shift_up", measure_throughput(legacy_shift_up_until_terminator, data, 1))
+    print_row("legacy shift_down", measure_throughput(legacy_shift_down, data, 1))
+
+    for backend in shift.BACKENDS:
+        try:
+            shift.set_backend(backend)
+        except ValueError as exc:
+            print(f"{backend + ' backend':<24}skipped ({exc})")
+            continue
+
+        print_row(
+            f"{backend} shift_up",
+            measure_throughput(shift.shift_up_until_terminator, data, args.repeat),
+        )
+        print_row(
+            f"{backend} shift_down",
+            measure_throughput(shift.shift_down, data, args.repeat),
+        )
+
+    shift.set_backend("table")
+
+
+# ==================
+# Streaming Decrypt
+# ==================
+
+
+def bench_stream(args):
+    access_keys = generate_access_keys()
+    decrypter = DBDDecrypter(access_keys)
+    encrypter = DBDEncrypter(access_keys)
+
+    print(f"{'size':<10}{'decrypt peak':>16}{'stream peak':>16}")
+
+    for size in args.sizes:
+        payload = encrypter.encrypt(generate_document(size * MEGABYTE), BENCHMARK_KEY_ID)
+
+        one_shot_peak = measure_peak_memory(
+            lambda: decrypter.decrypt(payload, BENCHMARK_KEY_ID)
+        )
+        source = io.BytesIO(payload.encode("ascii"))
+        stream_peak = measure_peak_memory(
+            lambda: decrypter.decrypt_stream(source, NullWriter(), BENCHMARK_KEY_ID)
+        )
+
+        print(
+            f"{str(size) + ' MB':<10}"
+            f"{one_shot_peak / MEGABYTE:>13.1f} MB"
+            f"{stream_peak / MEGABYTE:>13.1f} MB"
+        )
+
+
+# ==================
+# Compression Profiles
+# ==================
+
+
+def bench_compression(args):
+    access_keys = generate_access_keys()
+    document = generate_document(args.size * MEGABYTE)
+
+    print(f"Compression profiles, {args.size} MB document")
+    print(f"{'profile':<12}{'time':>10}{'peak':>12}{'payload':>14}")
+
+    for name in COMPRESSION_PROFILES:
+        encrypter = DBDEncrypter(access_keys, compression=name)
+
+        start = time.perf_counter()
+        payload = encrypter.encrypt(document, BENCHMARK_KEY_ID)
+        elapsed = time.perf_counter() - start
+
+        peak = measure_peak_memory(lambda: encrypter.encrypt(document, BENCHMARK_KEY_ID))
+
+        print(
+            f"{name:<12}{elapsed * 1000:>8.0f} ms"
+            f"{peak / MEGABYTE:>9.1f} MB"
+            f"{len(payload) / MEGABYTE:>11.2f} MB"
+        )
+
+
+# ==================
+# Cipher Cache
+# ==================
+
+
+def bench_cipher_cache(args):
+    access_keys = generate_access_keys()
+    payloads = [
+        DBDEncrypter(access_keys).encrypt(json.dumps({"index": index}), BENCHMARK_KEY_ID)
+        for index in range(args.count)
+    ]
+
+    for name, cipher_cache in (
+        ("uncached", CipherCache(max_size=0)),
+        ("cached", CipherCache()),
+    ):
+        decrypter = DBDDecrypter(access_keys, cipher_cache)
+
+        start = time.perf_counter()
+        for payload in payloads:
+            decrypter.decrypt(payload, BENCHMARK_KEY_ID)
+        elapsed = time.perf_counter() - start
+
+        stats = cipher_cache.stats()
+        print(
+            f"{name:<12}{args.count / elapsed:>12.0f} payloads/s"
+            f"  hits={stats['hits']} misses={stats['misses']}"
+        )
+
+
+# ==================
+# Bytes Decode Path
+# ==================
+
+
+def bench_bytes_path(args):
+    from utils import extract_dbd_payload
+
+    access_keys = generate_access_keys()
+    decrypter = DBDDecrypter(access_keys)
+    encrypter = DBDEncrypter(access_keys)
+
+    def decrypt_text(raw_bytes):
+        text = extract_dbd_payload(raw_bytes.decode("utf-8", errors="replace"))
+        decrypter.decrypt(text, BENCHMARK_KEY_ID)
+
+    def decrypt_bytes(raw_bytes):
+        decrypter.decrypt(extract_dbd_payload(raw_bytes), BENCHMARK_KEY_ID)
+
+    print(f"{'size':<10}{'path':<8}{'time':>10}{'python peak':>16}")
+
+    for size in args.sizes:
+        document = generate_incompressible_document(size * MEGABYTE)
+        payload = encrypter.encrypt(document, BENCHMARK_KEY_ID)
+        raw_bytes = b"HTTP/1.1 200 OK\r\n\r\n" + payload.encode("ascii")
+
+        for name, function in (("str", decrypt_text), ("bytes", decrypt_bytes)):
+            start = time.perf_counter()
+            function(raw_bytes)
+            elapsed = time.perf_counter() - start
+            peak = measure_peak_memory(lambda: function(raw_bytes))
+
+            print(
+                f"{str(size) + ' MB':<10}{name:<8}{elapsed:>9.3f}s"
+                f"{peak / MEGABYTE:>13.1f} MB"
+            )
+
+
+# ==================
+# GUI Startup
+# ==================
+
+
+def bench_startup(args):
+    start = time.perf_counter()
+
+    from PyQt6.QtWidgets import QApplication
+
+    from gui import run_gui
+    from utils import fetch_access_keys, load_cached_access_keys
+
+    def on_first_paint():
+        print(f"time to first paint   {time.perf_counter() - start:>8.3f}s")
+        QApplication.instance().quit()
+
+    try:
+        run_gui(load_cached_access_keys(), on_first_paint=on_first_paint)
+    except SystemExit:
+        pass
+
+    fetch_start = time.perf_counter()
+    fetch_access_keys()
+    print(f"key fetch (no longer blocking) {time.perf_counter() - fetch_start:>8.3f}s")
+
+
+# ==================
+# Output Viewer
+# ==================
+
+
+def bench_viewer(args):
+    from PyQt6.QtWidgets import QApplication, QTextEdit, QTreeView
+
+    from json_tree import JsonTreeModel
+
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    def render_tree(text):
+        view = QTreeView()
+        view.setModel(JsonTreeModel(json.loads(text), view))
+        view.show()
+        app.processEvents()
+        view.close()
+
+    def render_text(text):
+        view = QTextEdit()
+        view.setReadOnly(True)
+        view.setPlainText(JsonDocument(text).pretty())
+        view.show()
+        app.processEvents()
+        view.close()
+
+    viewers = [("tree", render_tree)]
+    if args.legacy:
+        viewers.append(("text", render_text))
+
+    print(f"{'size':<8}{'viewer':<8}{'render':>10}{'python peak':>16}")
+
+    for size in args.sizes:
+        text = generate_document(size * MEGABYTE)
+
+        for name, render in viewers:
+            start = time.perf_counter()
+            render(text)
+            elapsed = time.perf_counter() - start
+            peak = measure_peak_memory(lambda: render(text))
+
+            print(
+                f"{str(size) + ' MB':<8}{name:<8}{elapsed:>9.2f}s"
+                f"{peak / MEGABYTE:>13.1f} MB"
+            )
+
+
+# ==================
+# Suite
+# ==================
+
+
+def generate_key_api_response(count):
+    lines = []
+
+    for index in range(count):
+        key_id = f"{9 + index // 100}.{index // 10 % 10}.{index % 10}_live"
+        access_key = base64.b64encode(os.urandom(32)).decode("ascii")
+        lines.append(f'"{key_id}": "{access_key}"')
+
+    return "\n".join(lines)
+
+
+def generate_suite_payloads(encrypter, document):
+    """
+    Return a mapping of format name -> payload built from one document.
+    """
+    return {
+        "client-data": encrypter.encrypt(document, BENCHMARK_KEY_ID),
+        "full-profile": encrypter.encrypt_profile(document),
+        "zlib": encrypter.compress(document),
+    }
+
+
+def time_operation(function, min_time=SUITE_MIN_TIME):
+    """
+    Return the mean seconds per call, repeating until `min_time` has passed.
+    """
+    runs = 0
+    start = time.perf_counter()
+
+    while True:
+        function()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / runs
+
+
+def record_result(results, operation, payload_format, size, function):
+    seconds = time_operation(function)
+    peak = measure_peak_memory(function)
+
+    result = {
+        "operation": operation,
+        "format": payload_format,
+        "size": size,
+        "seconds": seconds,
+        "throughput_mb_s": size / MEGABYTE / seconds,
+        "peak_bytes": peak,
+    }
+    results.append(result)
+
+    print(
+        f"{operation:<20}{payload_format:<14}{format_size(size):>8}"
+        f"{seconds * 1000:>12.2f} ms{result['throughput_mb_s']:>10.1f} MB/s"
+        f"{peak / MEGABYTE:>10.1f} MB"
+    )
+
+
+def run_suite(sizes):
+    from utils import extract_dbd_payload, parse_access_keys
+
+    access_keys = generate_access_keys()
+    decrypter = DBDDecrypter(access_keys)
+    encrypter = DBDEncrypter(access_keys)
+    results = []
+
+    print(
+        f"{'operation':<20}{'format':<14}{'size':>8}"
+        f"{'time':>15}{'throughput':>15}{'peak':>13}"
+    )
+
+    for size in sizes:
+        document = generate_document(size)
+        payloads = generate_suite_payloads(encrypter, document)
+
+        record_result(
+            results,
+            "encrypt",
+            "client-data",
+            size,
+            lambda: encrypter.encrypt(document, BENCHMARK_KEY_ID),
+        )
+
+        for payload_format, payload in payloads.items():
+            record_result(
+                results,
+                "decrypt",
+                payload_format,
+                size,
+                lambda: decrypter.decrypt(payload, AUTO_KEY_ID),
+            )
+
+        raw_bytes = os.urandom(size // 2).hex().encode("ascii") + payloads[
+            "client-data"
+        ].encode("ascii")
+        record_result(
+            results,
+            "extract_dbd_payload",
+            "client-data",
+            size,
+            lambda: extract_dbd_payload(raw_bytes),
+        )
+
+    response_text = generate_key_api_response(1000)
+    record_result(
+        results,
+        "parse_access_keys",
+        "key-api",
+        len(response_text),
+        lambda: parse_access_keys(response_text),
+    )
+
+    return results
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Print throughput against a baseline and return the regressed entries.
+    """
+    baseline_results = {
+        (entry["operation"], entry["format"], entry["size"]): entry
+        for entry in baseline["results"]
+    }
+    regressions = []
+
+    print(f"\nCompared with baseline from {baseline['meta']['timestamp']}")
+
+    for result in results:
+        key = (result["operation"], result["format"], result["size"])
+        previous = baseline_results.get(key)
+
+        if previous is None:
+            continue
+
+        ratio = result["throughput_mb_s"] / previous["throughput_mb_s"]
+        regressed = ratio < 1 - tolerance
+        if regressed:
+            regressions.append(result)
+
+        print(
+            f"{'REGRESSED' if regressed else 'ok':<10}{result['operation']:<20}"
+            f"{result['format']:<14}{format_size(result['size']):>8}"
+            f"{(ratio - 1) * 100:>+9.1f}%"
+        )
+
+    return regressions
+
+
+def bench_suite(args):
+    results = run_suite(sorted(parse_size(size) for size in args.sizes))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "shift_backend": shift.get_backend(),
+        },
+        "results": results,
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nResults written to {args.output}")
+
+    if not args.baseline:
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = compare_results(results, baseline, args.tolerance)
+
+    if regressions:
+        print(f"FAILED  {len(regressions)} results regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+# ==================
+# Import Budget
+# ==================
+
+
+def measure_import_times(modules):
+    """
+    Import modules in a fresh interpreter with -X importtime.
+
+    Returns a mapping of module name -> cumulative import time in microseconds.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True,
+    )
+
+    import_times = {}
+
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line.split("|")
+        import_times[name.strip()] = int(cumulative)
+
+    return import_times
+
+
+def bench_import_budget(args):
+    import_times = measure_import_times(CORE_MODULES)
+    failures = []
+
+    total_ms = sum(import_times[module] for module in CORE_MODULES) / 1000
+    print(f"core import time      {total_ms:>8.1f} ms (budget {args.budget} ms)")
+
+    if total_ms > args.budget:
+        failures.append(f"import time {total_ms:.1f} ms exceeds {args.budget} ms")
+
+    for name in import_times:
+        if name.split(".", 1)[0] in CORE_FORBIDDEN_IMPORTS:
+            failures.append(f"{name} is imported by the core")
+
+    for failure in failures:
+        print(f"FAILED  {failure}")
+
+    if failures:
+        sys.exit(1)
+
+
+# ==================
+# Entry Point
+# ==================
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DBDCrypter benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    shift_parser = subparsers.add_parser("shift", help="byte-shift transform")
+    shift_parser.add_argument("--size", type=int, default=8, help="payload size in MB")
+    shift_parser.add_argument("--repeat", type=int, default=10)
+    shift_parser.set_defaults(handler=bench_shift)
+
+    stream_parser = subparsers.add_parser("stream", help="streaming decrypt memory")
+    stream_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1, 4, 16], help="document sizes in MB"
+    )
+    stream_parser.set_defaults(handler=bench_stream)
+
+    compression_parser = subparsers.add_parser(
+        "compression", help="encrypt time, memory and size per zlib profile"
+    )
+    compression_parser.add_argument(
+        "--size", type=int, default=16, help="document size in MB"
+    )
+    compression_parser.set_defaults(handler=bench_compression)
+
+    cache_parser = subparsers.add_parser("cipher-cache", help="small payload setup cost")
+    cache_parser.add_argument("--count", type=int, default=20000)
+    cache_parser.set_defaults(handler=bench_cipher_cache)
+
+    bytes_parser = subparsers.add_parser("bytes-path", help="str vs bytes decode path")
+    bytes_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1, 8], help="document sizes in MB"
+    )
+    bytes_parser.set_defaults(handler=bench_bytes_path)
+
+    startup_parser = subparsers.add_parser("startup", help="GUI time to first paint")
+    startup_parser.set_defaults(handler=bench_startup)
+
+    viewer_parser = subparsers.add_parser("viewer", help="output viewer render cost")
+    viewer_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1, 10, 50], help="document sizes in MB"
+    )
+    viewer_parser.add_argument(
+        "--legacy", action="store_true", help="also time the pretty-printed QTextEdit"
+    )
+    viewer_parser.set_defaults(handler=bench_viewer)
+
+    suite_parser = subparsers.add_parser(
+        "suite", help="all formats and sizes, saved to JSON and compared to a baseline"
+    )
+    suite_parser.add_argument(
+        "--sizes", nargs="+", default=list(SUITE_SIZES), help="sizes such as 1KB or 10MB"
+    )
+    suite_parser.add_argument("--output", default=SUITE_RESULTS_PATH)
+    suite_parser.add_argument("--baseline", help="results file to compare against")
+    suite_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=SUITE_TOLERANCE,
+        help="allowed throughput drop before failing (default: 0.10)",
+    )
+    suite_parser.set_defaults(handler=bench_suite)
+
+    budget_parser = subparsers.add_parser(
+        "import-budget", help="check core import time and dependencies"
+    )
+    budget_parser.add_argument("--budget", type=float, default=CORE_IMPORT_BUDGET_MS)
+    budget_parser.set_defaults(handler=bench_import_budget)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
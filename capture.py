@@ -0,0 +1,529 @@
+import argparse
+import base64
+import binascii
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+import json
+import os
+import re
+import sys
+import time
+
+from cli import (
+    add_output_format_argument,
+    add_result_cache_arguments,
+    expand_inputs,
+    result_cache_options,
+)
+from config import AUTO_KEY_ID, OUTPUT_FOLDER
+from core.decrypter import DBDDecrypter
+from core.output import get_output_format, join_parts, save_document, save_ndjson_part
+from core.result_cache import (
+    ResultCache,
+    counters_delta,
+    format_counters,
+    merge_counters,
+)
+from utils import (
+    PAYLOAD_KINDS,
+    PAYLOAD_PATTERN,
+    PAYLOAD_PREFIX_LENGTH,
+    fetch_access_keys,
+    iter_payload_spans,
+    open_input_file,
+)
+
+HAR_CHUNK_SIZE = 1024 * 1024
+HAR_SNIFF_SIZE = 4096
+
+# Payloads waiting in the pool per worker; bounds memory on huge captures.
+PENDING_PER_WORKER = 4
+
+NDJSON_FILENAME = "payloads.ndjson"
+
+# One pass over a raw dump picks up payloads together with the request line
+# and Date header that precede them.
+RAW_DUMP_RE = re.compile(
+    rb"(?P<payload>" + PAYLOAD_PATTERN.encode("ascii") + rb")"
+    rb"|^(?P<method>GET|POST|PUT|PATCH|DELETE) (?P<url>\S+) HTTP/\d"
+    rb"|^Date: (?P<date>[^\r\n]+)",
+    re.MULTILINE,
+)
+
+
+@dataclass
+class CapturedPayload:
+    entry: int
+    source: str
+    payload: str
+    url: str | None = None
+    method: str | None = None
+    started: str | None = None
+
+    @property
+    def kind(self):
+        return PAYLOAD_KINDS[self.payload[:PAYLOAD_PREFIX_LENGTH]]
+
+
+# ==================
+# HAR Parsing
+# ==================
+
+
+class HarReader:
+    """
+    Iterate over the entries of a HAR file without loading the whole file.
+
+    Only the entry being decoded is held in memory. Other fields under the
+    top-level object and "log" are decoded and discarded.
+    """
+
+    def __init__(self, file, chunk_size=HAR_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def entries(self):
+        for key in self._iter_object():
+            if key != "log":
+                self._decode()
+                continue
+
+            for log_key in self._iter_object():
+                if log_key != "entries":
+                    self._decode()
+                    continue
+
+                yield from self._iter_array()
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+
+        if self.pos:
+            self.buffer = self.buffer[self.pos :]
+            self.pos = 0
+
+        chunk = self.file.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buffer += chunk
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if not self._fill():
+                raise ValueError("Malformed HAR file: unexpected end of file.")
+
+    def _expect(self, characters):
+        character = self._peek()
+
+        if character not in characters:
+            raise ValueError(
+                f"Malformed HAR file: expected {' or '.join(characters)!r}, "
+                f"got {character!r}."
+            )
+
+        self.pos += 1
+        return character
+
+    def _decode(self):
+        self._peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as exc:
+                # Grow the read size with the buffer so a large entry is not
+                # re-parsed once per chunk.
+                pending_size = len(self.buffer) - self.pos
+                if self._fill(max(self.chunk_size, pending_size)):
+                    continue
+                raise ValueError(f"Malformed HAR file: {exc}") from None
+
+            # A number at the very end of the buffer may continue in the
+            # next chunk.
+            if end == len(self.buffer) and self._fill():
+                continue
+
+            self.pos = end
+            return value
+
+    def _iter_object(self):
+        """
+        Yield each key of an object; the caller must consume its value.
+        """
+        self._expect("{")
+
+        if self._peek() == "}":
+            self.pos += 1
+            return
+
+        while True:
+            key = self._decode()
+            if not isinstance(key, str):
+                raise ValueError("Malformed HAR file: object key is not a string.")
+
+            self._expect(":")
+            yield key
+
+            if self._expect(",}") == "}":
+                return
+
+    def _iter_array(self):
+        self._expect("[")
+
+        if self._peek() == "]":
+            self.pos += 1
+            return
+
+        while True:
+            yield self._decode()
+
+            if self._expect(",]") == "]":
+                return
+
+
+def _response_text(content):
+    text = content.get("text")
+
+    if not text or content.get("encoding") != "base64":
+        return text
+
+    try:
+        return str(base64.b64decode(text), "utf-8", errors="replace")
+    except binascii.Error:
+        return None
+
+
+def iter_har_payloads(file_path):
+    with open(file_path, "r", encoding="utf-8-sig") as f:
+        for entry_index, entry in enumerate(HarReader(f).entries()):
+            request = entry.get("request") or {}
+            response = entry.get("response") or {}
+
+            bodies = (
+                ("request", (request.get("postData") or {}).get("text")),
+                ("response", _response_text(response.get("content") or {})),
+            )
+
+            for source, text in bodies:
+                if not text:
+                    continue
+
+                for offset, length, _ in iter_payload_spans(text):
+                    yield CapturedPayload(
+                        entry_index,
+                        source,
+                        text[offset : offset + length],
+                        request.get("url"),
+                        request.get("method"),
+                        entry.get("startedDateTime"),
+                    )
+
+
+# ==================
+# Raw Dumps
+# ==================
+
+
+def iter_raw_payloads(file_path):
+    """
+    Yield payloads from a raw proxy dump or any other text file.
+
+    Entries are counted by HTTP request lines. Payloads seen before the first
+    request line belong to entry 0 without a URL.
+    """
+    with open_input_file(file_path) as data:
+        matches = RAW_DUMP_RE.finditer(data)
+
+        try:
+            entry_index = -1
+            url = method = date = None
+
+            for match in matches:
+                if match.lastgroup == "payload":
+                    yield CapturedPayload(
+                        max(entry_index, 0),
+                        "dump",
+                        match.group("payload").decode("ascii"),
+                        url,
+                        method,
+                        date,
+                    )
+
+                elif match.lastgroup == "url":
+                    entry_index += 1
+                    url = match.group("url").decode("ascii", errors="replace")
+                    method = match.group("method").decode("ascii")
+                    date = None
+
+                else:
+                    date = match.group("date").decode("ascii", errors="replace").strip()
+        finally:
+            # The scanner holds a view into the map until it is freed, also
+            # when the caller stops iterating early.
+            del matches
+
+
+def is_har_file(file_path):
+    if file_path.lower().endswith(".har"):
+        return True
+
+    with open(file_path, "rb") as f:
+        head = f.read(HAR_SNIFF_SIZE).lstrip(b"\xef\xbb\xbf \t\r\n")
+
+    return head.startswith(b"{") and b'"log"' in head
+
+
+def iter_capture_payloads(file_path):
+    if is_har_file(file_path):
+        return iter_har_payloads(file_path)
+    return iter_raw_payloads(file_path)
+
+
+# ==================
+# Workers
+# ==================
+
+_decrypter = None
+
+
+def _init_worker(access_keys, result_cache=None):
+    global _decrypter
+
+    _decrypter = DBDDecrypter(
+        access_keys,
+        result_cache=None if result_cache is None else ResultCache(**result_cache),
+    )
+
+
+def _decrypt_to_file(payload, key_id, save_path, output_format="pretty"):
+    """
+    Returns (used_key_id, cache_counters, written_path); cache_counters is
+    None without a result cache. NDJSON records are written to a part file
+    next to `save_path` for decrypt_capture() to join.
+    """
+    output_format = get_output_format(output_format)
+    result_cache = _decrypter.result_cache
+    cache_before = result_cache.counters() if result_cache else None
+
+    decrypt_result = _decrypter.decrypt_result(payload, key_id)
+
+    if output_format.ndjson:
+        record = (
+            decrypt_result.document,
+            os.path.basename(save_path),
+            decrypt_result.key_id,
+        )
+        written_path = save_ndjson_part(os.path.dirname(save_path), [record])
+    else:
+        written_path = save_document(save_path, decrypt_result.document, output_format)
+
+    cache_counters = (
+        counters_delta(cache_before, result_cache.counters()) if result_cache else None
+    )
+    return decrypt_result.key_id, cache_counters, written_path
+
+
+# ==================
+# Capture Runner
+# ==================
+
+
+def decrypt_capture(
+    file_path,
+    key_id,
+    access_keys,
+    output_folder,
+    workers=None,
+    result_cache=None,
+    output_format="pretty",
+):
+    """
+    Decrypt every payload in a capture into `output_folder`.
+
+    Each payload is saved as <entry>_<source>_<n>.json in `output_format`,
+    and index.json lists every payload with its URL, timestamp, key ID and
+    any error. With "ndjson", all payloads go to payloads.ndjson in index
+    order instead, and each record notes its line number.
+    `result_cache` holds ResultCache keyword arguments for each worker.
+    Returns (payload_count, failure_count, cache_counters); cache_counters is
+    None without a result cache.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+
+    workers = workers or os.cpu_count()
+    counters = {}
+    records = []
+    pending = {}
+    cache_counters = []
+    ndjson = get_output_format(output_format).ndjson
+    ndjson_parts = {}
+
+    def collect(futures):
+        for future in futures:
+            record = pending.pop(future)
+
+            try:
+                record["key_id"], payload_cache_counters, written_path = future.result()
+                if ndjson:
+                    ndjson_parts[record["file"]] = written_path
+                else:
+                    record["file"] = os.path.basename(written_path)
+                if payload_cache_counters:
+                    cache_counters.append(payload_cache_counters)
+            except Exception as exc:
+                record["error"] = str(exc)
+                print(
+                    f"FAILED  entry {record['entry']} ({record['url'] or 'no URL'}): {exc}",
+                    file=sys.stderr,
+                )
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(access_keys, result_cache),
+    ) as executor:
+        for captured in iter_capture_payloads(file_path):
+            counter_key = (captured.entry, captured.source)
+            counters[counter_key] = counters.get(counter_key, 0) + 1
+
+            filename = f"{captured.entry:05d}_{captured.source}_{counters[counter_key]}.json"
+            record = {
+                "entry": captured.entry,
+                "source": captured.source,
+                "method": captured.method,
+                "url": captured.url,
+                "started": captured.started,
+                "kind": captured.kind,
+                "file": filename,
+                "key_id": None,
+                "error": None,
+            }
+            # Listed in the order found; workers fill in their records.
+            records.append(record)
+
+            future = executor.submit(
+                _decrypt_to_file,
+                captured.payload,
+                key_id,
+                os.path.join(output_folder, filename),
+                output_format,
+            )
+            pending[future] = record
+
+            if len(pending) >= workers * PENDING_PER_WORKER:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        collect(wait(pending).done)
+
+    if ndjson:
+        part_paths = []
+
+        for record in records:
+            if record["error"]:
+                record["file"] = None
+                continue
+
+            part_paths.append(ndjson_parts[record["file"]])
+            record["file"] = NDJSON_FILENAME
+            record["line"] = len(part_paths)
+
+        join_parts(os.path.join(output_folder, NDJSON_FILENAME), part_paths)
+
+    with open(os.path.join(output_folder, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(records, f, indent=4)
+
+    failures = sum(1 for record in records if record["error"])
+    if result_cache is not None:
+        return len(records), failures, merge_counters(cache_counters)
+    return len(records), failures, None
+
+
+# ==================
+# Entry Point
+# ==================
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Decrypt every payload in HAR files or raw proxy dumps."
+    )
+    parser.add_argument("inputs", nargs="+", help="files, glob patterns or directories")
+    parser.add_argument(
+        "--key-id", default=AUTO_KEY_ID, help="key ID (default: detect per payload)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join(OUTPUT_FOLDER, "Captures"),
+        help="folder that receives one subfolder per capture",
+    )
+    add_result_cache_arguments(parser)
+    add_output_format_argument(parser)
+
+    args = parser.parse_args(argv)
+
+    try:
+        get_output_format(args.output_format)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+
+    file_paths = expand_inputs(args.inputs)
+    if not file_paths:
+        print("No input files found.", file=sys.stderr)
+        return 1
+
+    access_keys = fetch_access_keys()
+    result_cache = result_cache_options(args)
+    total_failures = 0
+
+    for file_path in file_paths:
+        capture_name = os.path.splitext(os.path.basename(file_path))[0]
+        output_folder = os.path.join(args.output, capture_name)
+        start = time.perf_counter()
+
+        try:
+            payload_count, failures, cache_counters = decrypt_capture(
+                file_path,
+                args.key_id,
+                access_keys,
+                output_folder,
+                args.workers,
+                result_cache,
+                args.output_format,
+            )
+        except (OSError, ValueError) as exc:
+            total_failures += 1
+            print(f"FAILED  {file_path}: {exc}", file=sys.stderr)
+            continue
+
+        total_failures += failures
+        print(
+            f"{file_path}: {payload_count - failures}/{payload_count} payloads "
+            f"decrypted in {time.perf_counter() - start:.2f}s -> {output_folder}"
+        )
+        if cache_counters:
+            print(f"  Result cache: {format_counters(cache_counters)}")
+
+    return 1 if total_failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
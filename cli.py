@@ -0,0 +1,597 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import json
+import os
+import sys
+import time
+
+from config import (
+    AUTO_KEY_ID,
+    DEEP_DECRYPT_MAX_DEPTH,
+    MMAP_THRESHOLD,
+    NESTED_MAP_SUFFIX,
+)
+from core.compression import COMPRESSION_PROFILES
+from core.decrypter import DBDDecrypter
+from core.document import JsonDocument
+from core.encrypter import DBDEncrypter
+from core.instrumentation import StageRecorder, format_summary, merge_summaries
+from core.nested import nested_map_from_json, nested_map_to_json
+from core.output import (
+    OUTPUT_FORMATS,
+    atomic_output,
+    get_output_format,
+    join_parts,
+    save_document,
+    save_ndjson_part,
+)
+from core.result_cache import (
+    ResultCache,
+    counters_delta,
+    format_counters,
+    merge_counters,
+)
+from core.stream import BufferReader
+from utils import (
+    build_output_path,
+    common_input_root,
+    extract_dbd_payload,
+    fetch_access_keys,
+    is_dbd_payload,
+    iter_payload_spans,
+    nested_map_path,
+    open_input_file,
+)
+
+MEGABYTE = 1024 * 1024
+
+# ==================
+# Input Discovery
+# ==================
+
+
+def expand_inputs(patterns):
+    """
+    Expand files, glob patterns and directories into a sorted list of files.
+
+    Directories are searched recursively.
+    """
+    file_paths = set()
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, filenames in os.walk(pattern):
+                for filename in filenames:
+                    file_paths.add(os.path.join(root, filename))
+            continue
+
+        matches = glob.glob(pattern, recursive=True) or [pattern]
+        file_paths.update(match for match in matches if not os.path.isdir(match))
+
+    return sorted(file_paths)
+
+
+# ==================
+# Shared Options
+# ==================
+
+
+def add_result_cache_arguments(parser):
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="decrypt repeated payloads once and reuse the result",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="also keep decrypted results in this folder, shared with other "
+        "processes and later runs (implies --cache)",
+    )
+
+
+def add_output_format_argument(parser):
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=tuple(OUTPUT_FORMATS),
+        default="pretty",
+        help="how results are saved: indented or compact JSON, gzip or zstd "
+        "compressed JSON, or NDJSON with one record per line "
+        "(default: pretty; zstd needs the zstandard package)",
+    )
+
+
+def result_cache_options(args):
+    """
+    Return ResultCache keyword arguments for the parsed cache options, or
+    None when caching is off.
+    """
+    if not (args.cache or args.cache_dir):
+        return None
+    return {"disk_path": args.cache_dir}
+
+
+# ==================
+# Workers
+# ==================
+
+_decrypter = None
+_encrypter = None
+
+
+def _init_worker(access_keys, compression=None, result_cache=None):
+    """
+    `result_cache` is None or the keyword arguments of a ResultCache built
+    once per worker process.
+    """
+    global _decrypter, _encrypter
+
+    _decrypter = DBDDecrypter(
+        access_keys,
+        result_cache=None if result_cache is None else ResultCache(**result_cache),
+    )
+    _encrypter = DBDEncrypter(access_keys, compression=compression)
+
+
+def _decrypt_file(file_path, key_id, max_depth=0):
+    with open_input_file(file_path) as raw_bytes:
+        data = extract_dbd_payload(raw_bytes)
+
+        try:
+            if not is_dbd_payload(data):
+                raise ValueError("Input is already decrypted or is in an invalid format.")
+
+            if max_depth:
+                decrypt_result = _decrypter.decrypt_deep(data, key_id, max_depth)
+                nested = decrypt_result.nested
+            else:
+                decrypt_result = _decrypter.decrypt_result(data, key_id)
+                nested = {}
+        finally:
+            if isinstance(data, memoryview):
+                data.release()
+
+        return len(raw_bytes), decrypt_result.document, decrypt_result.key_id, nested
+
+
+def _stream_decrypt_file(file_path, key_id, save_path, output_format):
+    """
+    Decrypt the first payload in a file straight into `save_path` with
+    decrypt_stream, so memory use stays flat however large the file is.
+
+    The text is saved exactly as decrypted, without JSON validation or
+    reformatting. Returns (input_size, used_key_id).
+    """
+    with open_input_file(file_path) as raw_bytes:
+        span = next(iter_payload_spans(raw_bytes), None)
+
+        if span is None:
+            raise ValueError("Input is already decrypted or is in an invalid format.")
+
+        offset, length, _ = span
+        reader = BufferReader(raw_bytes, offset, offset + length)
+
+        try:
+            with atomic_output(save_path, output_format) as stream:
+                used_key_id = _decrypter.decrypt_stream(reader, stream, key_id)
+        finally:
+            reader.release()
+
+        return len(raw_bytes), used_key_id
+
+
+def _encrypt_file(file_path, key_ids, restore_nested=False):
+    """
+    Encrypt a file for every key ID in `key_ids`, compressing it only once.
+
+    Returns (input_size, payloads, nested, saved_seconds), where payloads
+    maps each key ID to its encrypted text.
+    """
+    with open(file_path, "rb") as f:
+        raw_bytes = f.read()
+
+    data = raw_bytes.decode("utf-8")
+
+    if is_dbd_payload(data):
+        raise ValueError("Input is already encrypted or is in an invalid format.")
+
+    document = JsonDocument(data)
+
+    if document.is_blank or not document.is_valid():
+        raise ValueError("Encryption input must be valid JSON.")
+
+    map_path = nested_map_path(file_path)
+
+    if restore_nested and os.path.exists(map_path):
+        with open(map_path, "r", encoding="utf-8") as f:
+            nested = nested_map_from_json(json.load(f))
+
+        plaintext = _encrypter.restore_nested(document, nested)
+    else:
+        nested = {}
+        plaintext = document
+
+    if len(key_ids) == 1:
+        payloads = {key_ids[0]: _encrypter.encrypt(plaintext, key_ids[0])}
+        return len(raw_bytes), payloads, nested, 0.0
+
+    multi = _encrypter.encrypt_many(plaintext, key_ids)
+    return len(raw_bytes), multi.payloads, nested, multi.saved_seconds
+
+
+def process_file(
+    mode,
+    file_path,
+    key_id,
+    record_stages=False,
+    max_depth=0,
+    key_ids=None,
+    output_format="pretty",
+    stream=False,
+    input_root=None,
+):
+    """
+    Run one file through the worker's decrypter or encrypter and save it in
+    `output_format`. NDJSON results go to a part file for the batch runner
+    to join; save_path is then that part.
+
+    Outputs keep the file's path below `input_root`, as returned by
+    common_input_root for the whole batch, so same-named files from
+    different folders are saved separately.
+
+    With `stream`, decrypted files of at least MMAP_THRESHOLD bytes are
+    decrypted straight to disk instead; see _stream_decrypt_file.
+
+    When encrypting, several `key_ids` give one output per key ID under
+    Output/Encrypted/<key ID>; save_path is then the first of them.
+
+    A non-zero `max_depth` decrypts nested payloads and saves their map
+    next to the output, or restores them from the map next to the input
+    when encrypting.
+
+    Returns (file_path, save_path, input_size, used_key_id, stage_summary,
+    cache_counters, saved_seconds); stage_summary is None unless
+    `record_stages` is set, cache_counters is None unless the worker has a
+    result cache, and saved_seconds is the time not spent compressing again
+    for the extra key IDs. Errors propagate to the caller.
+    """
+    output_format = get_output_format(output_format)
+    stage_recorder = StageRecorder() if record_stages else None
+    _decrypter.instrumentation = _encrypter.instrumentation = stage_recorder
+
+    result_cache = _decrypter.result_cache
+    cache_before = result_cache.counters() if result_cache else None
+
+    outputs = []
+    nested = {}
+    saved_seconds = 0.0
+
+    if mode == "decrypt" and stream and os.path.getsize(file_path) >= MMAP_THRESHOLD:
+        save_path = output_format.output_path(
+            build_output_path("Decrypted", file_path, input_root)
+        )
+        input_size, used_key_id = _stream_decrypt_file(
+            file_path, key_id, save_path, output_format
+        )
+    elif mode == "decrypt":
+        input_size, result, used_key_id, nested = _decrypt_file(
+            file_path, key_id, max_depth
+        )
+        outputs = [
+            (build_output_path("Decrypted", file_path, input_root), result, used_key_id)
+        ]
+    else:
+        input_size, payloads, nested, saved_seconds = _encrypt_file(
+            file_path, key_ids or [key_id], restore_nested=bool(max_depth)
+        )
+        used_key_id = ", ".join(payloads)
+
+        for payload_key_id, payload in payloads.items():
+            subfolder = "Encrypted"
+            if len(payloads) > 1 and not output_format.ndjson:
+                subfolder = os.path.join(subfolder, payload_key_id)
+            outputs.append(
+                (
+                    build_output_path(subfolder, file_path, input_root),
+                    payload,
+                    payload_key_id,
+                )
+            )
+
+    # Streamed files are already saved and leave `outputs` empty.
+    if outputs and output_format.ndjson:
+        save_path = save_ndjson_part(
+            os.path.dirname(outputs[0][0]),
+            [(output, file_path, output_key) for _, output, output_key in outputs],
+        )
+    elif outputs:
+        saved_paths = [
+            save_document(output_path, output, output_format)
+            for output_path, output, _ in outputs
+        ]
+        save_path = saved_paths[0]
+
+    if mode == "decrypt" and nested:
+        with open(nested_map_path(outputs[0][0]), "w", encoding="utf-8") as f:
+            json.dump(nested_map_to_json(nested), f, indent=4)
+
+    stage_summary = stage_recorder.summary() if stage_recorder else None
+    cache_counters = (
+        counters_delta(cache_before, result_cache.counters()) if result_cache else None
+    )
+    return (
+        file_path,
+        save_path,
+        input_size,
+        used_key_id,
+        stage_summary,
+        cache_counters,
+        saved_seconds,
+    )
+
+
+# ==================
+# Batch Runner
+# ==================
+
+
+def run_batch(
+    mode,
+    file_paths,
+    key_id,
+    access_keys,
+    workers=None,
+    compression=None,
+    record_stages=False,
+    max_depth=0,
+    result_cache=None,
+    key_ids=None,
+    output_format="pretty",
+    stream=False,
+):
+    """
+    Process files across a process pool, reporting failures without stopping.
+
+    With `record_stages`, per-stage timings from every file are added
+    together and printed after the summary. `result_cache` holds ResultCache
+    keyword arguments for each worker; its hit rate is printed at the end.
+    Several `key_ids` encrypt every file for each of them. With the
+    "ndjson" `output_format`, all results are joined into one file in input
+    order. Returns the number of failed files.
+    """
+    ndjson_path = None
+    ndjson_parts = {}
+
+    if get_output_format(output_format).ndjson:
+        ndjson_path = OUTPUT_FORMATS["ndjson"].output_path(
+            build_output_path("Decrypted" if mode == "decrypt" else "Encrypted")
+        )
+
+    failures = 0
+    total_bytes = 0
+    stage_summaries = []
+    cache_counters = []
+    saved_seconds = 0.0
+    input_root = common_input_root(file_paths)
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(access_keys, compression, result_cache),
+    ) as executor:
+        futures = {
+            executor.submit(
+                process_file,
+                mode,
+                file_path,
+                key_id,
+                record_stages,
+                max_depth,
+                key_ids,
+                output_format,
+                stream,
+                input_root,
+            ): file_path
+            for file_path in file_paths
+        }
+
+        for future in as_completed(futures):
+            file_path = futures[future]
+
+            try:
+                (
+                    _,
+                    save_path,
+                    input_size,
+                    used_key_id,
+                    stage_summary,
+                    file_cache_counters,
+                    file_saved_seconds,
+                ) = future.result()
+            except Exception as exc:
+                failures += 1
+                print(f"FAILED  {file_path}: {exc}", file=sys.stderr)
+                continue
+
+            total_bytes += input_size
+            saved_seconds += file_saved_seconds
+            if ndjson_path:
+                ndjson_parts[file_path] = save_path
+                save_path = ndjson_path
+            if stage_summary:
+                stage_summaries.append(stage_summary)
+            if file_cache_counters:
+                cache_counters.append(file_cache_counters)
+            print(f"OK      {file_path} -> {save_path} [{used_key_id or 'no key'}]")
+
+    if ndjson_parts:
+        join_parts(
+            ndjson_path,
+            [ndjson_parts[path] for path in file_paths if path in ndjson_parts],
+        )
+
+    elapsed = time.perf_counter() - start
+    succeeded = len(file_paths) - failures
+    throughput = total_bytes / MEGABYTE / elapsed if elapsed else 0.0
+
+    print(
+        f"Processed {succeeded}/{len(file_paths)} files "
+        f"({failures} failed) in {elapsed:.2f}s, {throughput:.1f} MB/s"
+    )
+
+    if stage_summaries:
+        print("Stage timings across all files:")
+        for line in format_summary(merge_summaries(stage_summaries)):
+            print(f"  {line}")
+
+    if cache_counters:
+        print(f"Result cache: {format_counters(merge_counters(cache_counters))}")
+
+    if key_ids and len(key_ids) > 1:
+        print(
+            f"Encrypted for {len(key_ids)} key IDs; compressing once saved "
+            f"{saved_seconds:.2f}s of worker time"
+        )
+
+    return failures
+
+
+# ==================
+# Entry Point
+# ==================
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Decrypt or encrypt Dead by Daylight payloads without the GUI."
+    )
+    parser.add_argument("mode", choices=("decrypt", "encrypt"))
+    parser.add_argument("inputs", nargs="+", help="files, glob patterns or directories")
+    parser.add_argument(
+        "--key-id",
+        default=AUTO_KEY_ID,
+        help="key ID, e.g. 9.5.0_live (default: detect when decrypting, "
+        "latest live key when encrypting); when encrypting, a comma-separated "
+        "list writes one output per key ID",
+    )
+    parser.add_argument(
+        "--all-branches",
+        action="store_true",
+        help="when encrypting, also encrypt for every other branch of the "
+        "key ID's version, e.g. live, ptb and stage",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--compression",
+        choices=tuple(COMPRESSION_PROFILES),
+        default="default",
+        help="zlib profile used when encrypting (default: default)",
+    )
+    parser.add_argument(
+        "--stage-timings",
+        action="store_true",
+        help="print time spent in each pipeline stage, summed over all files",
+    )
+    parser.add_argument(
+        "--deep",
+        action="store_true",
+        help="decrypt payloads nested in the JSON and save a map next to each "
+        "output; when encrypting, restore them from that map",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=DEEP_DECRYPT_MAX_DEPTH,
+        help=f"nesting levels followed by --deep (default: {DEEP_DECRYPT_MAX_DEPTH})",
+    )
+    add_result_cache_arguments(parser)
+    add_output_format_argument(parser)
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=f"decrypt files of {MMAP_THRESHOLD // MEGABYTE} MB or more with bounded "
+        "memory; they are saved exactly as decrypted, without JSON validation "
+        "or reformatting",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.stream and (args.deep or args.output_format == "ndjson"):
+        parser.error("--stream cannot be combined with --deep or --format ndjson")
+
+    if args.max_depth < 1:
+        parser.error("--max-depth must be at least 1")
+
+    key_ids = [key_id.strip() for key_id in args.key_id.split(",")]
+    key_ids = list(dict.fromkeys(key_id for key_id in key_ids if key_id))
+
+    if not key_ids:
+        parser.error("--key-id needs at least one key ID")
+
+    if AUTO_KEY_ID in key_ids and len(key_ids) > 1:
+        parser.error(f'--key-id "{AUTO_KEY_ID}" cannot be combined with other key IDs')
+
+    if args.mode == "decrypt" and len(key_ids) > 1:
+        parser.error("decryption takes a single key ID")
+
+    if args.mode == "decrypt" and args.all_branches:
+        parser.error("--all-branches only applies to encryption")
+
+    try:
+        get_output_format(args.output_format)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+
+    file_paths = [
+        file_path
+        for file_path in expand_inputs(args.inputs)
+        if not file_path.endswith(NESTED_MAP_SUFFIX)
+    ]
+    if not file_paths:
+        print("No input files found.", file=sys.stderr)
+        return 1
+
+    access_keys = fetch_access_keys()
+
+    if key_ids == [AUTO_KEY_ID] and args.mode == "encrypt":
+        key_ids = [access_keys.latest()]
+        if key_ids[0] is None:
+            print("No live key ID available.", file=sys.stderr)
+            return 1
+
+    for key_id in key_ids:
+        if key_id != AUTO_KEY_ID and key_id not in access_keys:
+            print(f'Key ID "{key_id}" was not found in access keys.', file=sys.stderr)
+            return 1
+
+    if args.all_branches:
+        branch_key_ids = []
+        for key_id in key_ids:
+            branch_key_ids += access_keys.for_version(access_keys.version(key_id))
+        key_ids = list(dict.fromkeys(branch_key_ids))
+
+    failures = run_batch(
+        args.mode,
+        file_paths,
+        key_ids[0],
+        access_keys,
+        args.workers,
+        args.compression,
+        args.stage_timings,
+        args.max_depth if args.deep else 0,
+        result_cache_options(args),
+        key_ids if len(key_ids) > 1 else None,
+        args.output_format,
+        args.stream,
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,5 @@
+import os
+
 # =========================
 # Configuration / Constants
 # =========================
@@ -5,9 +7,48 @@
 KEY_API_URL = "https://keyapi.deadbyqueue.com/keys"
 REQUEST_TIMEOUT = 5
 
+KEY_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".dbdcrypter", "access_keys.json")
+
+# Background key refresh for long-running sessions, in seconds. Failed
+# refreshes are retried after KEY_REFRESH_RETRY, doubling up to the normal
+# interval; every delay is randomized by +/- KEY_REFRESH_JITTER.
+KEY_REFRESH_INTERVAL = 15 * 60
+KEY_REFRESH_RETRY = 30
+KEY_REFRESH_JITTER = 0.1
+# Minimum time between refreshes triggered by an unknown key ID.
+KEY_ON_DEMAND_REFRESH_INTERVAL = 60
+
 MIN_VERSION = (9, 5, 0)
 EXCLUDED_PREFIXES = ("9999.", "m_5.")
 
+OUTPUT_FOLDER = "Output"
+
+# Input files at least this large are memory-mapped instead of read.
+MMAP_THRESHOLD = 16 * 1024 * 1024
+MMAP_SCAN_WINDOW = 16 * 1024 * 1024
+
+# Key ID that makes the decrypter read the key from the payload header.
+AUTO_KEY_ID = "auto"
+MAX_KEY_ID_LENGTH = 64
+
+CIPHER_CACHE_SIZE = 32
+
+# Result cache for repeated payloads: text kept in memory per process, and
+# the size of the optional on-disk tier.
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_DISK_MAX_BYTES = 512 * 1024 * 1024
+
+# Deep decrypt: how many levels of payloads-inside-JSON to follow, and the
+# file that records them next to saved output so they can be re-encrypted.
+DEEP_DECRYPT_MAX_DEPTH = 4
+NESTED_MAP_SUFFIX = ".nested.json"
+
+# Local HTTP service (service.py). Bound to loopback only by default.
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_MAX_CONCURRENCY = 32
+SERVICE_MAX_BODY_SIZE = 256 * 1024 * 1024
+
 # =========================
 # Data Prefixes
 # =========================
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+import threading
+
+from config import CIPHER_CACHE_SIZE, EncryptionKeys
+from utils import decode_access_key
+
+
+def new_ecb_cipher(aes_key):
+    # pycryptodome is imported on first use so importing the core stays cheap.
+    from Crypto.Cipher import AES
+
+    return AES.new(aes_key, AES.MODE_ECB)
+
+
+class CipherCache:
+    """
+    Bounded LRU cache of decoded AES keys and ECB cipher objects per key ID.
+
+    Entries remember the access key they were built from, so a key ID whose
+    access key changes is rebuilt on its next lookup. ECB cipher objects keep
+    no state between calls and can be shared by decrypter and encrypter.
+    """
+
+    def __init__(self, max_size=CIPHER_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._full_profile_cipher = None
+        self._lock = threading.Lock()
+
+    def get(self, key_id, access_key, aes_key=None):
+        """
+        Return (aes_key, cipher) for a key ID, building them on a miss.
+
+        Pass `aes_key` when it is already decoded, e.g. from a KeyRing.
+        """
+        with self._lock:
+            entry = self._entries.get(key_id)
+
+            if entry is not None and entry[0] == access_key:
+                self._entries.move_to_end(key_id)
+                self.hits += 1
+                return entry[1], entry[2]
+
+            self.misses += 1
+
+        if aes_key is None:
+            aes_key = decode_access_key(access_key)
+        cipher = new_ecb_cipher(aes_key)
+
+        with self._lock:
+            self._entries[key_id] = (access_key, aes_key, cipher)
+            self._entries.move_to_end(key_id)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return aes_key, cipher
+
+    def full_profile_cipher(self):
+        with self._lock:
+            if self._full_profile_cipher is not None:
+                self.hits += 1
+                return self._full_profile_cipher
+
+            self.misses += 1
+            self._full_profile_cipher = new_ecb_cipher(EncryptionKeys.FULL_PROFILE_AES)
+            return self._full_profile_cipher
+
+    def invalidate(self):
+        """
+        Drop all per-key entries. Call this when the access key set changes.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+default_cipher_cache = CipherCache()
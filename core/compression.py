@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+import zlib
+
+# Characters encoded and fed to the compressor per step on the streaming path.
+COMPRESSION_CHUNK_SIZE = 256 * 1024
+
+
+@dataclass(frozen=True)
+class CompressionProfile:
+    """
+    zlib settings for the DbdDAQEB layer.
+
+    Every profile produces a standard zlib stream that the game can read.
+    With `streaming` enabled, the text is encoded to UTF-16 and compressed
+    in chunks, so the whole UTF-16 copy is never held in memory.
+    """
+
+    level: int = zlib.Z_DEFAULT_COMPRESSION
+    strategy: int = zlib.Z_DEFAULT_STRATEGY
+    mem_level: int = zlib.DEF_MEM_LEVEL
+    streaming: bool = False
+    chunk_size: int = COMPRESSION_CHUNK_SIZE
+
+    def compress_utf16(self, text):
+        """
+        Return (compressed_bytes, uncompressed_size) for `text` as UTF-16-LE.
+        """
+        if not self.streaming:
+            utf16_bytes = text.encode("utf-16-le")
+            compressor = self._compressobj()
+            compressed_bytes = compressor.compress(utf16_bytes) + compressor.flush()
+            return compressed_bytes, len(utf16_bytes)
+
+        compressor = self._compressobj()
+        compressed_parts = []
+        uncompressed_size = 0
+
+        # Slicing by code point never splits a surrogate pair, since each
+        # character is encoded whole.
+        for start in range(0, len(text), self.chunk_size):
+            utf16_bytes = text[start : start + self.chunk_size].encode("utf-16-le")
+            uncompressed_size += len(utf16_bytes)
+            compressed_parts.append(compressor.compress(utf16_bytes))
+
+        compressed_parts.append(compressor.flush())
+        return b"".join(compressed_parts), uncompressed_size
+
+    def _compressobj(self):
+        return zlib.compressobj(
+            self.level, zlib.DEFLATED, zlib.MAX_WBITS, self.mem_level, self.strategy
+        )
+
+
+COMPRESSION_PROFILES = {
+    "default": CompressionProfile(),
+    "fast": CompressionProfile(level=1, streaming=True),
+    "balanced": CompressionProfile(level=6, streaming=True),
+    "small": CompressionProfile(level=9, mem_level=zlib.DEF_MEM_LEVEL + 1, streaming=True),
+}
+
+
+def get_compression_profile(profile):
+    """
+    Resolve a profile name or CompressionProfile instance.
+    """
+    if profile is None:
+        return COMPRESSION_PROFILES["default"]
+
+    if isinstance(profile, CompressionProfile):
+        return profile
+
+    try:
+        return COMPRESSION_PROFILES[profile]
+    except KeyError:
+        raise ValueError(
+            f'Unknown compression profile "{profile}". '
+            f"Choose from: {', '.join(COMPRESSION_PROFILES)}."
+        ) from None
@@ -1,95 +1,295 @@
-import base64
-import json
+import binascii
+from dataclasses import dataclass, field
 import zlib
 
-from Crypto.Cipher import AES
+from config import AUTO_KEY_ID, DEEP_DECRYPT_MAX_DEPTH, MAX_KEY_ID_LENGTH, DataPrefixes
+from core.cipher_cache import default_cipher_cache
+from core.document import JsonDocument
+from core.instrumentation import NULL_STAGE
+from core.nested import deep_decrypt
+from core.shift import shift_up, shift_up_until_terminator
+from core.stream import (
+    STREAM_CHUNK_SIZE,
+    iter_aes_decrypt,
+    iter_ascii_decode,
+    iter_ascii_encode,
+    iter_base64_decode,
+    iter_inflate,
+    iter_shift_until_terminator,
+    iter_utf16_decode,
+    peek,
+    read_chunks,
+    take,
+)
+from utils import (
+    PAYLOAD_PREFIX_LENGTH,
+    PAYLOAD_PREFIXES,
+    UnknownKeyIdError,
+    as_key_ring,
+)
 
-from config import DataPrefixes, EncryptionKeys
-from utils import decode_access_key
+
+CLIENT_DATA_PREFIX = DataPrefixes.CLIENT_DATA.encode("ascii")
+FULL_PROFILE_PREFIX = DataPrefixes.FULL_PROFILE.encode("ascii")
+ZLIB_PREFIX = DataPrefixes.ZLIB.encode("ascii")
+
+
+@dataclass
+class DecryptResult:
+    document: JsonDocument
+    key_id: str | None = None
+
+    @property
+    def text(self):
+        return self.document.text
+
+
+@dataclass
+class DeepDecryptResult(DecryptResult):
+    # JSON Pointer -> NestedPayload for every substituted payload.
+    nested: dict = field(default_factory=dict)
+    # JSON Pointer -> error message for payloads left encrypted.
+    errors: dict = field(default_factory=dict)
 
 
 class DBDDecrypter:
-    def __init__(self, access_keys):
-        self.access_keys = access_keys
+    def __init__(
+        self,
+        access_keys,
+        cipher_cache=None,
+        progress=None,
+        instrumentation=None,
+        result_cache=None,
+    ):
+        self.access_keys = as_key_ring(access_keys)
+        self.cipher_cache = cipher_cache or default_cipher_cache
+        self.progress = progress
+        self.instrumentation = instrumentation
+        # Optional ResultCache; repeated payloads skip the pipeline entirely.
+        self.result_cache = result_cache
 
     def decrypt(self, content, version_with_branch):
-        if content.startswith(DataPrefixes.CLIENT_DATA):
-            return self._decrypt_client_data(content, version_with_branch)
+        return self.decrypt_result(content, version_with_branch).text
+
+    def decrypt_result(self, content, version_with_branch):
+        """
+        Decrypt content and report which key ID was used.
+
+        Pass AUTO_KEY_ID as `version_with_branch` to read the key ID from the
+        client-data header instead of requiring the caller to choose one.
+        `key_id` is None when no client-data layer was present.
+
+        `content` may be str, bytes or a memoryview; payloads stay in bytes
+        until the final text is decoded.
+        """
+        document, key_id = self._decrypt_cached(content, version_with_branch)
+        return DecryptResult(document, key_id)
+
+    def decrypt_deep(
+        self,
+        content,
+        version_with_branch,
+        max_depth=DEEP_DECRYPT_MAX_DEPTH,
+        executor=None,
+    ):
+        """
+        Decrypt content, then decrypt payloads nested in its JSON values.
+
+        Nested payloads are always decrypted with AUTO_KEY_ID, since they
+        may use a different key from the outer payload. Pass the returned
+        `nested` map to DBDEncrypter.encrypt_deep to restore them.
+        """
+        document, key_id = self._decrypt_cached(content, version_with_branch)
+
+        if document.is_blank:
+            return DeepDecryptResult(document, key_id)
+
+        # A separate decrypter keeps progress and stage timings, which are
+        # not thread-safe, out of the concurrent nested decrypts.
+        nested_decrypter = DBDDecrypter(
+            self.access_keys, self.cipher_cache, result_cache=self.result_cache
+        )
+
+        value, nested, errors = deep_decrypt(
+            document.value,
+            nested_decrypter,
+            max_depth,
+            executor,
+            progress=self._report_progress,
+        )
+
+        if nested:
+            document = JsonDocument.from_value(value, document.parse_count)
+
+        return DeepDecryptResult(document, key_id, nested, errors)
+
+    def _decrypt_cached(self, content, version_with_branch):
+        if self.result_cache is None:
+            return self._decrypt(content, version_with_branch)
 
-        if content.startswith(DataPrefixes.FULL_PROFILE):
-            return self._decrypt_profile(content, version_with_branch)
+        with self._stage("cache", len(content)):
+            digest = self.result_cache.digest(content, version_with_branch)
+            cached = self.result_cache.get(digest, self.access_keys)
 
-        if content.startswith(DataPrefixes.ZLIB):
-            return self._decompress_zlib(content, version_with_branch)
+        if cached is not None:
+            self._report_progress("cache")
+            return JsonDocument(cached.text), cached.key_id
 
-        if content and not self._is_valid_json(content):
+        document, key_id = self._decrypt(content, version_with_branch)
+        self.result_cache.put(
+            digest, document.text, key_id, self.access_keys, len(content)
+        )
+        return document, key_id
+
+    def _decrypt(self, content, version_with_branch):
+        if self.instrumentation is None:
+            return self._decrypt_layer(content, version_with_branch)
+
+        with self.instrumentation.nested():
+            return self._decrypt_layer(content, version_with_branch)
+
+    def _decrypt_layer(self, content, version_with_branch):
+        if isinstance(content, str):
+            if not content.startswith(PAYLOAD_PREFIXES):
+                return self._validate_json(content)
+            content = content.encode("ascii")
+
+        view = memoryview(content)
+        prefix = view[:PAYLOAD_PREFIX_LENGTH]
+
+        if prefix == CLIENT_DATA_PREFIX:
+            return self._decrypt_client_data(view, version_with_branch)
+
+        if prefix == FULL_PROFILE_PREFIX:
+            return self._decrypt_profile(view, version_with_branch)
+
+        if prefix == ZLIB_PREFIX:
+            return self._decompress_zlib(view, version_with_branch)
+
+        return self._validate_json(str(view, "utf-8"))
+
+    def _validate_json(self, content):
+        self._report_progress("json")
+        document = JsonDocument(content)
+
+        with self._stage("json", len(content)):
+            is_valid = document.is_valid()
+
+        if not is_valid:
             raise ValueError(
                 "Invalid JSON output. Access key may be incorrect or data may be corrupted."
             )
 
-        return content
+        return document, None
+
+    def decrypt_stream(
+        self, source, writer, version_with_branch, chunk_size=STREAM_CHUNK_SIZE
+    ):
+        """
+        Decrypt a payload read incrementally from `source` into `writer`.
+
+        Each stage works on bounded chunks, so memory use does not grow with
+        the payload size. Plaintext is written as it is produced and is not
+        validated as JSON, since that would require holding all of it.
+
+        Returns the key ID used, or None when no client-data layer was
+        present.
+        """
+        chunks = read_chunks(source, chunk_size)
+        key_ids = []
+
+        for text in self._stream_payload(
+            chunks, version_with_branch, chunk_size, key_ids
+        ):
+            writer.write(text)
+
+        return key_ids[0] if key_ids else None
+
+    def _report_progress(self, stage):
+        # The callback may raise OperationCancelled to stop between stages.
+        if self.progress is not None:
+            self.progress(stage)
+
+    def _stage(self, stage, size):
+        if self.instrumentation is None:
+            return NULL_STAGE
+        return self.instrumentation.stage(stage, size)
+
+    def _decode_base64(self, encoded):
+        with self._stage("base64", len(encoded)):
+            return binascii.a2b_base64(encoded)
+
+    def _decrypt_client_data(self, view, version_with_branch):
+        self._report_progress("base64")
+        raw_payload = self._decode_base64(view[PAYLOAD_PREFIX_LENGTH:])
+
+        slice_length = self._key_id_slice_length(raw_payload, version_with_branch)
+
+        key_id, cipher = self._resolve_client_key(
+            raw_payload[:slice_length], version_with_branch
+        )
+
+        ciphertext = memoryview(raw_payload)[slice_length:]
+
+        document, _ = self._decode_aes_payload(ciphertext, cipher, version_with_branch)
+        return document, key_id
 
     @staticmethod
-    def _is_valid_json(text):
-        if not text.strip():
-            return True
-        try:
-            json.loads(text)
-            return True
-        except json.JSONDecodeError:
-            return False
+    def _key_id_slice_length(raw_header, version_with_branch):
+        if version_with_branch != AUTO_KEY_ID:
+            return len(version_with_branch) + 1
 
-    def _decrypt_client_data(self, content, version_with_branch):
-        encoded_payload = content[len(DataPrefixes.CLIENT_DATA) :]
-        raw_payload = base64.b64decode(encoded_payload)
+        terminator_index = raw_header.find(b"\x00", 0, MAX_KEY_ID_LENGTH + 1)
+        if terminator_index == -1:
+            raise ValueError("Key ID header was not found in payload.")
 
-        slice_length = len(version_with_branch) + 1
+        return terminator_index + 1
 
-        key_id_bytes = raw_payload[:slice_length]
-        key_id_bytes = bytes((byte + 1) % 256 for byte in key_id_bytes)
+    @staticmethod
+    def _parse_key_id(key_id_bytes):
+        key_id_bytes = shift_up(key_id_bytes)
+        return str(key_id_bytes, "ascii").replace("\u0001", "")
 
-        key_id = key_id_bytes.decode("ascii").replace("\u0001", "")
+    def _resolve_client_key(self, key_id_bytes, version_with_branch):
+        key_id = self._parse_key_id(key_id_bytes)
 
         access_key = self.access_keys.get(key_id)
         if not access_key:
-            raise ValueError(f'Key ID "{key_id}" was not found in access keys.')
+            raise UnknownKeyIdError(
+                f'Key ID "{key_id}" was not found in access keys.', key_id
+            )
 
-        if key_id != version_with_branch:
+        if version_with_branch != AUTO_KEY_ID and key_id != version_with_branch:
             raise ValueError(
                 f'Expected "{version_with_branch}" but payload was encrypted with "{key_id}".'
             )
 
-        aes_key = decode_access_key(access_key)
-
-        ciphertext = raw_payload[slice_length:]
-
-        return self._decode_aes_payload(ciphertext, aes_key, version_with_branch)
+        _, cipher = self.cipher_cache.get(
+            key_id, access_key, self.access_keys.aes_key(key_id)
+        )
+        return key_id, cipher
 
-    def _decrypt_profile(self, content, version_with_branch):
-        encoded_payload = content[len(DataPrefixes.FULL_PROFILE) :]
-        raw_payload = base64.b64decode(encoded_payload)
+    def _decrypt_profile(self, view, version_with_branch):
+        self._report_progress("base64")
+        raw_payload = self._decode_base64(view[PAYLOAD_PREFIX_LENGTH:])
 
         return self._decode_aes_payload(
-            raw_payload, EncryptionKeys.FULL_PROFILE_AES, version_with_branch
+            raw_payload, self.cipher_cache.full_profile_cipher(), version_with_branch
         )
 
-    def _decode_aes_payload(self, ciphertext, aes_key, version_with_branch):
-        cipher = AES.new(aes_key, AES.MODE_ECB)
-        decrypted_bytes = cipher.decrypt(ciphertext)
-
-        result_bytes = bytearray()
+    def _decode_aes_payload(self, ciphertext, cipher, version_with_branch):
+        self._report_progress("aes")
+        with self._stage("aes", len(ciphertext)):
+            decrypted_bytes = cipher.decrypt(ciphertext)
 
-        for byte in decrypted_bytes:
-            if byte == 0:
-                break
-            result_bytes.append((byte + 1) % 256)
+        with self._stage("shift", len(decrypted_bytes)):
+            plaintext = shift_up_until_terminator(decrypted_bytes)
 
-        plaintext = result_bytes.decode("ascii")
-        return self.decrypt(plaintext, version_with_branch)
+        return self._decrypt(plaintext, version_with_branch)
 
-    def _decompress_zlib(self, content, version_with_branch):
-        encoded_payload = content[len(DataPrefixes.ZLIB) :]
-        raw_payload = base64.b64decode(encoded_payload)
+    def _decompress_zlib(self, view, version_with_branch):
+        self._report_progress("base64")
+        raw_payload = self._decode_base64(view[PAYLOAD_PREFIX_LENGTH:])
 
         if len(raw_payload) < 4:
             raise ValueError("Invalid zlib payload.")
@@ -97,13 +297,90 @@ class DBDDecrypter:
         size_header = raw_payload[:4]
         expected_size = int.from_bytes(size_header, "little")
 
-        compressed_data = raw_payload[4:]
-        inflated_bytes = zlib.decompress(compressed_data)
+        self._report_progress("zlib")
+        compressed_data = memoryview(raw_payload)[4:]
+        with self._stage("zlib", len(compressed_data)):
+            try:
+                inflated_bytes = zlib.decompress(compressed_data)
+            except zlib.error as exc:
+                raise ValueError(f"Invalid zlib payload: {exc}") from None
 
         if len(inflated_bytes) != expected_size:
             raise ValueError(
                 f"Zlib size mismatch. Expected {expected_size}, got {len(inflated_bytes)}."
             )
 
-        plaintext = inflated_bytes.decode("utf-16")
-        return self.decrypt(plaintext, version_with_branch)
+        with self._stage("utf16", len(inflated_bytes)):
+            plaintext = inflated_bytes.decode("utf-16")
+
+        return self._decrypt(plaintext, version_with_branch)
+
+    def _stream_payload(self, chunks, version_with_branch, chunk_size, key_ids):
+        prefix, chunks = peek(chunks, PAYLOAD_PREFIX_LENGTH)
+
+        if prefix is None:
+            return
+
+        prefix = prefix.decode("ascii", errors="replace")
+
+        if prefix == DataPrefixes.CLIENT_DATA:
+            _, chunks = take(chunks, len(prefix))
+            raw_chunks = iter_base64_decode(chunks)
+
+            raw_header, raw_chunks = peek(raw_chunks, MAX_KEY_ID_LENGTH + 1)
+            slice_length = self._key_id_slice_length(
+                raw_header or b"", version_with_branch
+            )
+
+            key_id_bytes, raw_chunks = take(raw_chunks, slice_length)
+            key_id, cipher = self._resolve_client_key(
+                key_id_bytes or b"", version_with_branch
+            )
+            key_ids.append(key_id)
+
+            yield from self._stream_aes_payload(
+                raw_chunks, cipher, version_with_branch, chunk_size, key_ids
+            )
+
+        elif prefix == DataPrefixes.FULL_PROFILE:
+            _, chunks = take(chunks, len(prefix))
+            raw_chunks = iter_base64_decode(chunks)
+
+            yield from self._stream_aes_payload(
+                raw_chunks,
+                self.cipher_cache.full_profile_cipher(),
+                version_with_branch,
+                chunk_size,
+                key_ids,
+            )
+
+        elif prefix == DataPrefixes.ZLIB:
+            _, chunks = take(chunks, len(prefix))
+            raw_chunks = iter_base64_decode(chunks)
+            text_chunks = iter_utf16_decode(iter_inflate(raw_chunks, chunk_size))
+
+            text_prefix, text_chunks = peek(text_chunks, PAYLOAD_PREFIX_LENGTH)
+
+            if text_prefix is not None and text_prefix.startswith(PAYLOAD_PREFIXES):
+                yield from self._stream_payload(
+                    iter_ascii_encode(text_chunks),
+                    version_with_branch,
+                    chunk_size,
+                    key_ids,
+                )
+            else:
+                yield from text_chunks
+
+        else:
+            yield from iter_ascii_decode(chunks)
+
+    def _stream_aes_payload(
+        self, raw_chunks, cipher, version_with_branch, chunk_size, key_ids
+    ):
+        plaintext_chunks = iter_shift_until_terminator(
+            iter_aes_decrypt(raw_chunks, cipher)
+        )
+
+        yield from self._stream_payload(
+            plaintext_chunks, version_with_branch, chunk_size, key_ids
+        )
@@ -0,0 +1,71 @@
+import json
+
+_UNPARSED = object()
+
+
+class JsonDocument:
+    """
+    Raw JSON text together with its parsed value, parsed at most once.
+
+    Validation, pretty-printing, display and saving all share the same parse.
+    `parse_count` records how many times the text was actually parsed.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.parse_count = 0
+
+        self._value = _UNPARSED
+        self._error = None
+
+    @classmethod
+    def from_value(cls, value, parse_count=0):
+        """
+        Build a document from an already parsed value without parsing again.
+
+        `parse_count` carries over parses of the text the value came from.
+        """
+        document = cls(json.dumps(value))
+        document.parse_count = parse_count
+        document._value = value
+        return document
+
+    @property
+    def is_blank(self):
+        return not self.text or self.text.isspace()
+
+    @property
+    def value(self):
+        self._parse()
+
+        if self._error is not None:
+            raise self._error
+
+        return self._value
+
+    def is_valid(self):
+        if self.is_blank:
+            return True
+
+        self._parse()
+        return self._error is None
+
+    def pretty(self):
+        """
+        Return the document indented by 4, or the raw text if it is not JSON.
+        """
+        if self.is_blank or not self.is_valid():
+            return self.text
+
+        return json.dumps(self._value, indent=4)
+
+    def _parse(self):
+        if self._value is not _UNPARSED or self._error is not None:
+            return
+
+        self.parse_count += 1
+
+        try:
+            self._value = json.loads(self.text)
+        except json.JSONDecodeError as exc:
+            self._error = exc
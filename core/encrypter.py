@@ -1,60 +1,269 @@
 import base64
-import zlib
-
-from Crypto.Cipher import AES
+from dataclasses import dataclass
+import json
+import time
 
 from config import DataPrefixes
-from utils import decode_access_key
+from core.cipher_cache import default_cipher_cache
+from core.compression import get_compression_profile
+from core.document import JsonDocument
+from core.instrumentation import NULL_STAGE
+from core.nested import restore_nested_payloads
+from core.shift import shift_down
+from utils import UnknownKeyIdError, as_key_ring
+
+
+@dataclass
+class MultiEncryptResult:
+    # Key ID -> DbdDAwAC payload, in the order the key IDs were given.
+    payloads: dict
+    # Time spent once on the stages every key ID shares (zlib, shift).
+    shared_seconds: float
+    # Key ID -> time spent on that key's AES and base64 stages.
+    key_seconds: dict
+
+    @property
+    def saved_seconds(self):
+        """
+        Time separate encrypt() calls would have spent repeating the
+        shared stages.
+        """
+        return self.shared_seconds * (len(self.payloads) - 1)
 
 
 class DBDEncrypter:
-    def __init__(self, access_keys):
-        self.access_keys = access_keys
+    def __init__(
+        self,
+        access_keys,
+        cipher_cache=None,
+        progress=None,
+        compression=None,
+        instrumentation=None,
+    ):
+        self.access_keys = as_key_ring(access_keys)
+        self.cipher_cache = cipher_cache or default_cipher_cache
+        self.progress = progress
+        self.compression = get_compression_profile(compression)
+        self.instrumentation = instrumentation
 
     def encrypt(self, plaintext, version_with_branch):
+        """
+        Return a DbdDAwAC client-data payload encrypted for a key ID.
+        """
+        plaintext = self._require_text(plaintext)
+        cipher = self._get_cipher(version_with_branch)
+        encoded_payload = self._prepare_zlib_payload(self._compress(plaintext))
+
+        return self._encrypt_for_key(encoded_payload, cipher, version_with_branch)
+
+    def encrypt_many(self, plaintext, key_ids, executor=None):
+        """
+        Encrypt one document for several key IDs and return a
+        MultiEncryptResult.
+
+        The text is compressed and shifted once; only AES and base64 run per
+        key ID, concurrently on `executor` (a thread pool by default). Every
+        key ID is checked before any work starts. Progress and stage timings
+        are reported from the calling thread as each key ID finishes.
+        """
+        plaintext = self._require_text(plaintext)
+        key_ids = list(dict.fromkeys(key_ids))
+
+        if not key_ids:
+            raise ValueError("No key IDs to encrypt for.")
+
+        ciphers = {key_id: self._get_cipher(key_id) for key_id in key_ids}
+
+        start = time.perf_counter()
+        encoded_payload = self._prepare_zlib_payload(self._compress(plaintext))
+        shared_seconds = time.perf_counter() - start
+
+        def encrypt_for_key(key_id):
+            # Runs on worker threads. Progress callbacks and the stage
+            # recorder are not thread-safe, so the timings are returned and
+            # recorded by the calling thread.
+            aes_start = time.perf_counter()
+            ciphertext = ciphers[key_id].encrypt(encoded_payload)
+            base64_start = time.perf_counter()
+            payload = self._build_encrypted_payload(
+                ciphertext, self._derive_key_id(key_id)
+            )
+            end = time.perf_counter()
+            return (
+                payload,
+                len(ciphertext),
+                base64_start - aes_start,
+                end - base64_start,
+            )
+
+        payloads = {}
+        key_seconds = {}
+
+        def collect(key_id, result):
+            payload, ciphertext_size, aes_seconds, base64_seconds = result
+
+            self._report_progress("aes")
+            self._record_stage("aes", aes_seconds, len(encoded_payload))
+            self._report_progress("base64")
+            self._record_stage("base64", base64_seconds, ciphertext_size)
+
+            payloads[key_id] = payload
+            key_seconds[key_id] = aes_seconds + base64_seconds
+
+        if len(key_ids) == 1:
+            collect(key_ids[0], encrypt_for_key(key_ids[0]))
+        elif executor is not None:
+            self._collect_results(executor, encrypt_for_key, key_ids, collect)
+        else:
+            # Imported here so single-key callers never pay for it.
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(
+                max_workers=len(key_ids), thread_name_prefix="encrypt-many"
+            ) as own_executor:
+                self._collect_results(own_executor, encrypt_for_key, key_ids, collect)
+
+        return MultiEncryptResult(
+            {key_id: payloads[key_id] for key_id in key_ids},
+            shared_seconds,
+            {key_id: key_seconds[key_id] for key_id in key_ids},
+        )
+
+    @staticmethod
+    def _collect_results(executor, function, key_ids, collect):
+        from concurrent.futures import as_completed
+
+        futures = {executor.submit(function, key_id): key_id for key_id in key_ids}
+
+        try:
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+        finally:
+            # A cancelled progress callback or a failed key leaves the rest
+            # unstarted.
+            for future in futures:
+                future.cancel()
+
+    def encrypt_deep(self, document, nested, version_with_branch):
+        """
+        Re-encrypt nested payloads recorded by decrypt_deep, then the whole.
+
+        `document` is a JsonDocument or JSON text; the nested payloads reuse
+        the key IDs they were decrypted with.
+        """
+        return self.encrypt(self.restore_nested(document, nested), version_with_branch)
+
+    def restore_nested(self, document, nested):
+        """
+        Return the JSON text of `document` with its nested payloads
+        re-encrypted, ready for encrypt() or encrypt_many().
+        """
+        if not isinstance(document, JsonDocument):
+            document = JsonDocument(self._require_text(document))
+
+        value = restore_nested_payloads(document.value, nested, self)
+        return json.dumps(value)
+
+    def encrypt_profile(self, plaintext):
+        """
+        Return a DbdDAgAC full-profile payload, which needs no access key.
+        """
+        plaintext = self._require_text(plaintext)
+        encoded_payload = self._prepare_zlib_payload(self._compress(plaintext))
+
+        self._report_progress("aes")
+        ciphertext = self._encrypt_with_aes(
+            self.cipher_cache.full_profile_cipher(), encoded_payload
+        )
+
+        self._report_progress("base64")
+        with self._stage("base64", len(ciphertext)):
+            encoded_ciphertext = base64.b64encode(ciphertext).decode("ascii")
+
+        return DataPrefixes.FULL_PROFILE + encoded_ciphertext
+
+    def compress(self, plaintext):
+        """
+        Return a bare DbdDAQEB zlib payload without any AES layer.
+        """
+        return self._compress(self._require_text(plaintext)).decode("ascii")
+
+    @staticmethod
+    def _require_text(plaintext):
+        if isinstance(plaintext, JsonDocument):
+            plaintext = plaintext.text
+
         if not plaintext:
             raise ValueError("Input data is empty.")
 
-        aes_key = self._get_aes_key(version_with_branch)
-        cipher = AES.new(aes_key, AES.MODE_ECB)
+        return plaintext
 
-        utf16_bytes = plaintext.encode("utf-16-le")
-        compressed_bytes = zlib.compress(utf16_bytes)
-        size_header = len(utf16_bytes).to_bytes(4, "little")
+    def _compress(self, plaintext):
+        self._report_progress("zlib")
+        with self._stage("zlib", len(plaintext)):
+            compressed_bytes, uncompressed_size = self.compression.compress_utf16(
+                plaintext
+            )
 
-        encoded_payload = self._prepare_zlib_payload(compressed_bytes, size_header)
-        ciphertext = self._encrypt_with_aes(cipher, encoded_payload)
-        key_id = self._derive_key_id(version_with_branch)
+        size_header = uncompressed_size.to_bytes(4, "little")
+
+        self._report_progress("base64")
+        with self._stage("base64", len(compressed_bytes) + 4):
+            encoded_bytes = base64.b64encode(size_header + compressed_bytes)
+
+        return DataPrefixes.ZLIB.encode() + encoded_bytes
+
+    def _report_progress(self, stage):
+        # The callback may raise OperationCancelled to stop between stages.
+        if self.progress is not None:
+            self.progress(stage)
+
+    def _stage(self, stage, size):
+        if self.instrumentation is None:
+            return NULL_STAGE
+        return self.instrumentation.stage(stage, size)
 
-        return self._build_encrypted_payload(ciphertext, key_id)
+    def _record_stage(self, stage, seconds, size):
+        if self.instrumentation is not None:
+            self.instrumentation.record(stage, seconds, size)
 
-    def _get_aes_key(self, version_with_branch):
+    def _get_cipher(self, version_with_branch):
         access_key = self.access_keys.get(version_with_branch)
 
         if not access_key:
-            raise ValueError(f'Access key not found for "{version_with_branch}".')
+            raise UnknownKeyIdError(
+                f'Access key not found for "{version_with_branch}".', version_with_branch
+            )
 
-        return decode_access_key(access_key)
+        _, cipher = self.cipher_cache.get(
+            version_with_branch, access_key, self.access_keys.aes_key(version_with_branch)
+        )
+        return cipher
 
-    @staticmethod
-    def _prepare_zlib_payload(compressed_bytes, size_header):
-        combined_bytes = size_header + compressed_bytes
-        prefixed_bytes = DataPrefixes.ZLIB.encode() + base64.b64encode(combined_bytes)
+    def _encrypt_for_key(self, encoded_payload, cipher, version_with_branch):
+        self._report_progress("aes")
+        ciphertext = self._encrypt_with_aes(cipher, encoded_payload)
+        key_id = self._derive_key_id(version_with_branch)
 
-        shifted_bytes = bytearray((byte - 1) % 256 for byte in prefixed_bytes)
+        self._report_progress("base64")
+        with self._stage("base64", len(ciphertext)):
+            return self._build_encrypted_payload(ciphertext, key_id)
 
-        while len(shifted_bytes) % 16 != 0:
-            shifted_bytes.append(0)
+    def _prepare_zlib_payload(self, prefixed_bytes):
+        with self._stage("shift", len(prefixed_bytes)):
+            shifted_bytes = shift_down(prefixed_bytes)
 
-        return bytes(shifted_bytes)
+        padding_length = -len(shifted_bytes) % 16
 
-    @staticmethod
-    def _encrypt_with_aes(cipher, data):
-        return cipher.encrypt(data)
+        return shifted_bytes + b"\x00" * padding_length
+
+    def _encrypt_with_aes(self, cipher, data):
+        with self._stage("aes", len(data)):
+            return cipher.encrypt(data)
 
     @staticmethod
     def _derive_key_id(version_with_branch):
-        return bytes((byte - 1) % 256 for byte in version_with_branch.encode())
+        return shift_down(version_with_branch.encode())
 
     def _build_encrypted_payload(self, ciphertext, key_id):
         payload = key_id + b"\x00" + ciphertext
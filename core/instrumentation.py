@@ -0,0 +1,109 @@
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+import time
+
+# Returned by the crypto classes when no recorder is attached, so a disabled
+# stage costs one attribute check and an empty with-block.
+NULL_STAGE = nullcontext()
+
+
+@dataclass
+class StageRecord:
+    stage: str
+    layer: int
+    seconds: float
+    size: int
+
+
+class StageRecorder:
+    """
+    Collects the duration and input size of each pipeline stage.
+
+    `layer` is 1 for the outermost payload and grows by one for each nested
+    payload found inside it, so a client-data payload wrapping a zlib
+    payload reports its zlib stages on layer 2. Sizes are in bytes, or in
+    characters for stages whose input is text.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.layer = 0
+
+    @contextmanager
+    def nested(self):
+        self.layer += 1
+        try:
+            yield
+        finally:
+            self.layer -= 1
+
+    @contextmanager
+    def stage(self, stage, size):
+        layer = max(self.layer, 1)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append(
+                StageRecord(stage, layer, time.perf_counter() - start, size)
+            )
+
+    def record(self, stage, seconds, size):
+        """
+        Add a stage timed elsewhere, e.g. on a worker thread.
+        """
+        self.records.append(StageRecord(stage, max(self.layer, 1), seconds, size))
+
+    def summary(self):
+        """
+        Return totals keyed by (layer, stage) in the order stages first ran.
+
+        Each value is a dict with "seconds", "size" and "calls".
+        """
+        totals = {}
+
+        for record in self.records:
+            total = totals.setdefault(
+                (record.layer, record.stage), {"seconds": 0.0, "size": 0, "calls": 0}
+            )
+            total["seconds"] += record.seconds
+            total["size"] += record.size
+            total["calls"] += 1
+
+        return totals
+
+    def total_seconds(self):
+        return sum(record.seconds for record in self.records)
+
+
+def merge_summaries(summaries):
+    """
+    Add several summary() results together, e.g. from batch workers.
+    """
+    merged = {}
+
+    for summary in summaries:
+        for key, total in summary.items():
+            merged_total = merged.setdefault(key, {"seconds": 0.0, "size": 0, "calls": 0})
+            for field, value in total.items():
+                merged_total[field] += value
+
+    return merged
+
+
+def format_summary(summary):
+    """
+    Return one line per stage: layer, stage, time, share of total and size.
+    """
+    total_seconds = sum(total["seconds"] for total in summary.values()) or 1.0
+    lines = []
+
+    for (layer, stage), total in summary.items():
+        calls = f" x{total['calls']}" if total["calls"] > 1 else ""
+        lines.append(
+            f"L{layer} {stage:<8}{total['seconds'] * 1000:>9.2f} ms"
+            f"{total['seconds'] / total_seconds:>6.0%}"
+            f"{total['size'] / 1024:>12.1f} KB{calls}"
+        )
+
+    return lines
@@ -0,0 +1,234 @@
+from dataclasses import asdict, dataclass
+import json
+
+from config import AUTO_KEY_ID, DataPrefixes
+from utils import PAYLOAD_PREFIX_LENGTH, PAYLOAD_PREFIXES
+
+
+@dataclass
+class NestedPayload:
+    """
+    Where a nested payload was found and how to encrypt it again.
+
+    `path` is a JSON Pointer into the fully decrypted document and `depth`
+    is 1 for payloads found directly in the outer document.
+    """
+
+    path: str
+    prefix: str
+    depth: int
+    key_id: str | None = None
+
+
+# ==================
+# JSON Pointers
+# ==================
+
+
+def to_pointer(parts):
+    return "".join(
+        "/" + str(part).replace("~", "~0").replace("/", "~1") for part in parts
+    )
+
+
+def from_pointer(pointer):
+    if not pointer:
+        return ()
+
+    return tuple(
+        part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/")
+    )
+
+
+def _set_path(root, parts, value):
+    """
+    Replace the value at `parts` and return the (possibly new) root.
+    """
+    if not parts:
+        return value
+
+    container = root
+    for part in parts[:-1]:
+        container = container[int(part) if isinstance(container, list) else part]
+
+    last = parts[-1]
+    container[int(last) if isinstance(container, list) else last] = value
+    return root
+
+
+def _copy_once(container, copied):
+    if id(container) in copied:
+        return container
+
+    container = container.copy()
+    copied.add(id(container))
+    return container
+
+
+def _replace_path(root, parts, value, copied):
+    """
+    Like _set_path, but copies each container on the path the first time it
+    is touched so the caller's document is left unchanged.
+    """
+    if not parts:
+        return value
+
+    root = container = _copy_once(root, copied)
+
+    for part in parts[:-1]:
+        key = int(part) if isinstance(container, list) else part
+        container[key] = _copy_once(container[key], copied)
+        container = container[key]
+
+    last = parts[-1]
+    container[int(last) if isinstance(container, list) else last] = value
+    return root
+
+
+def _get_path(root, parts):
+    value = root
+    for part in parts:
+        value = value[int(part) if isinstance(value, list) else part]
+    return value
+
+
+def iter_nested_payloads(value):
+    """
+    Yield (parts, payload) for every string value that is a DBD payload.
+
+    Walks with an explicit stack so deeply nested documents cannot hit the
+    recursion limit.
+    """
+    stack = [((), value)]
+
+    while stack:
+        parts, current = stack.pop()
+
+        if isinstance(current, str):
+            if current.startswith(PAYLOAD_PREFIXES):
+                yield parts, current
+        elif isinstance(current, dict):
+            stack.extend((parts + (key,), child) for key, child in current.items())
+        elif isinstance(current, list):
+            stack.extend((parts + (index,), child) for index, child in enumerate(current))
+
+
+# ==================
+# Deep Decrypt / Restore
+# ==================
+
+
+def deep_decrypt(value, decrypter, max_depth, executor=None, progress=None):
+    """
+    Decrypt nested payloads in `value` level by level and substitute them.
+
+    All payloads found at one depth are decrypted concurrently on
+    `executor`, a thread pool by default; AES and zlib release the GIL for
+    large buffers. Payloads that fail to decrypt are left as strings.
+
+    Returns (value, nested, errors) where `nested` maps JSON Pointer ->
+    NestedPayload and `errors` maps JSON Pointer -> message.
+    """
+    nested = {}
+    errors = {}
+    pending = list(iter_nested_payloads(value))
+
+    if not pending:
+        return value, nested, errors
+
+    own_executor = executor is None
+    if own_executor:
+        # Imported here so callers without nested payloads never pay for it.
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(thread_name_prefix="nested-decrypt")
+
+    try:
+        depth = 1
+
+        while pending and depth <= max_depth:
+            if progress is not None:
+                progress("nested")
+
+            futures = [
+                (parts, payload, executor.submit(decrypter.decrypt_result, payload, AUTO_KEY_ID))
+                for parts, payload in pending
+            ]
+            pending = []
+
+            for parts, payload, future in futures:
+                pointer = to_pointer(parts)
+
+                try:
+                    decrypt_result = future.result()
+                    inner_value = decrypt_result.document.value
+                except ValueError as exc:
+                    errors[pointer] = str(exc)
+                    continue
+
+                value = _set_path(value, parts, inner_value)
+                nested[pointer] = NestedPayload(
+                    pointer,
+                    payload[:PAYLOAD_PREFIX_LENGTH],
+                    depth,
+                    decrypt_result.key_id,
+                )
+                pending.extend(
+                    (parts + inner_parts, inner_payload)
+                    for inner_parts, inner_payload in iter_nested_payloads(inner_value)
+                )
+
+            depth += 1
+
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    return value, nested, errors
+
+
+def restore_nested_payloads(value, nested, encrypter):
+    """
+    Encrypt each recorded path back into a payload string, deepest first.
+
+    Returns a new root; `value` itself is not modified.
+    """
+    copied = set()
+    by_depth = sorted(
+        nested.values(), key=lambda payload: len(from_pointer(payload.path)), reverse=True
+    )
+
+    for payload in by_depth:
+        parts = from_pointer(payload.path)
+        text = json.dumps(_get_path(value, parts), separators=(",", ":"), ensure_ascii=False)
+
+        if payload.prefix == DataPrefixes.CLIENT_DATA:
+            if payload.key_id is None:
+                raise ValueError(f'No key ID recorded for nested payload "{payload.path}".')
+            encrypted = encrypter.encrypt(text, payload.key_id)
+        elif payload.prefix == DataPrefixes.FULL_PROFILE:
+            encrypted = encrypter.encrypt_profile(text)
+        else:
+            encrypted = encrypter.compress(text)
+
+        value = _replace_path(value, parts, encrypted, copied)
+
+    return value
+
+
+# ==================
+# Serialization
+# ==================
+
+
+def nested_map_to_json(nested):
+    return {"payloads": [asdict(payload) for payload in nested.values()]}
+
+
+def nested_map_from_json(data):
+    try:
+        payloads = [NestedPayload(**entry) for entry in data["payloads"]]
+    except (KeyError, TypeError) as exc:
+        raise ValueError(f"Invalid nested payload map: {exc}") from None
+
+    return {payload.path: payload for payload in payloads}
@@ -0,0 +1,291 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+import functools
+import gzip
+import importlib.util
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from core.document import JsonDocument
+
+# List items serialized together per chunk of compact output.
+OUTPUT_LIST_BATCH = 1024
+# Container levels split into chunks before whole values are serialized.
+OUTPUT_SPLIT_DEPTH = 2
+# Characters gathered from small chunks before each write to the file.
+OUTPUT_WRITE_SIZE = 256 * 1024
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    """
+    How a saved result is serialized and compressed.
+
+    JSON output is written in chunks, so the serialized text is never held
+    in memory as a whole. Text that is not JSON, such as an encrypted
+    payload, is written unchanged. `ndjson` writes one record per line with
+    the source file and key ID next to the data.
+    """
+
+    indent: int | None = None
+    compression: str | None = None
+    ndjson: bool = False
+    # Appended to the save path, or replacing its extension with `ndjson`.
+    suffix: str = ""
+
+    def output_path(self, save_path):
+        if self.ndjson:
+            return os.path.splitext(save_path)[0] + self.suffix
+        return save_path + self.suffix
+
+
+OUTPUT_FORMATS = {
+    "pretty": OutputFormat(indent=4),
+    "compact": OutputFormat(),
+    "gzip": OutputFormat(compression="gzip", suffix=".gz"),
+    "zstd": OutputFormat(compression="zstd", suffix=".zst"),
+    "ndjson": OutputFormat(ndjson=True, suffix=".ndjson"),
+}
+NDJSON_FORMAT = OUTPUT_FORMATS["ndjson"]
+NDJSON_PART_SUFFIX = ".ndjson.part"
+
+
+def zstd_available():
+    return importlib.util.find_spec("zstandard") is not None
+
+
+def get_output_format(name):
+    """
+    Return the OutputFormat called `name`, checking that it can be written.
+    """
+    output_format = OUTPUT_FORMATS.get(name)
+
+    if output_format is None:
+        raise ValueError(f'Unknown output format "{name}".')
+
+    if output_format.compression == "zstd" and not zstd_available():
+        raise ValueError(
+            'zstd output needs the "zstandard" package: pip install zstandard'
+        )
+
+    return output_format
+
+
+# ==================
+# Serialization
+# ==================
+
+
+def iter_json(value, indent=None, depth=OUTPUT_SPLIT_DEPTH, level=0):
+    """
+    Yield `value` as JSON in chunks, identical to json.dumps(value, indent)
+    with compact separators when `indent` is None.
+
+    The outer `depth` levels of objects and arrays are split up; deeper
+    values and batches of list items are encoded whole with json's own
+    encoder, so chunks stay small without a per-token Python loop.
+    """
+    encode = _encoder(indent)
+
+    if indent is None:
+        newline = closing = reindent = ""
+        key_separator = ":"
+    else:
+        reindent = " " * (indent * level)
+        newline = "\n" + reindent + " " * indent
+        closing = "\n" + reindent
+        key_separator = ": "
+
+    if depth and isinstance(value, dict) and value:
+        separator = "{"
+        for key, item in value.items():
+            yield separator + newline + encode(str(key)) + key_separator
+            yield from iter_json(item, indent, depth - 1, level + 1)
+            separator = ","
+        yield closing + "}"
+
+    elif depth and isinstance(value, list) and value:
+        separator = "["
+        for start in range(0, len(value), OUTPUT_LIST_BATCH):
+            batch = encode(value[start : start + OUTPUT_LIST_BATCH])
+            # Drop the brackets, and the line breaks around them when indented.
+            items = batch[1:-1] if indent is None else batch[2 + indent : -2]
+            yield separator + newline + _reindent(items, reindent)
+            separator = ","
+        yield closing + "]"
+
+    else:
+        yield _reindent(encode(value), reindent)
+
+
+@functools.lru_cache(maxsize=None)
+def _encoder(indent):
+    if indent is None:
+        return json.JSONEncoder(separators=(",", ":")).encode
+    return json.JSONEncoder(indent=indent).encode
+
+
+def _reindent(text, prefix):
+    return text.replace("\n", "\n" + prefix) if prefix else text
+
+
+def iter_document(document, output_format):
+    """
+    Yield the text of `document` (a JsonDocument or plain text) in chunks.
+    """
+    if not isinstance(document, JsonDocument):
+        yield document
+        return
+
+    if document.is_blank or not document.is_valid():
+        yield document.text
+        return
+
+    yield from iter_json(document.value, output_format.indent)
+
+
+def write_document(stream, document, output_format, source=None, key_id=None):
+    """
+    Write one document to an open text stream in `output_format`.
+    """
+    if not output_format.ndjson:
+        _write_chunks(stream, iter_document(document, output_format))
+        return
+
+    encode = _encoder(None)
+    stream.write(f'{{"file":{encode(source)},"key_id":{encode(key_id)},"data":')
+
+    if not isinstance(document, JsonDocument):
+        chunks = [encode(document)]
+    elif document.is_blank or not document.is_valid():
+        chunks = [encode(document.text)]
+    else:
+        chunks = iter_json(document.value)
+
+    _write_chunks(stream, chunks)
+    stream.write("}\n")
+
+
+def _write_chunks(stream, chunks):
+    # The indented encoder yields millions of tiny chunks; joining them in
+    # bounded groups keeps per-write overhead down without holding the
+    # whole text.
+    pending = []
+    pending_size = 0
+
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+
+        if pending_size >= OUTPUT_WRITE_SIZE:
+            stream.write("".join(pending))
+            pending.clear()
+            pending_size = 0
+
+    stream.write("".join(pending))
+
+
+# ==================
+# Atomic Writes
+# ==================
+
+
+@contextmanager
+def atomic_output(file_path, output_format):
+    """
+    Open a text stream whose contents replace `file_path` only once the
+    block completes; on error the file is left untouched.
+    """
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    try:
+        with open(temp_path, "wb") as raw, _open_compressed(
+            raw, output_format.compression
+        ) as binary:
+            stream = io.TextIOWrapper(binary, encoding="utf-8", newline="")
+            try:
+                yield stream
+            finally:
+                # Flush without closing; `binary` is closed by its own
+                # context so compressors can write their trailer.
+                stream.detach()
+
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def _open_compressed(raw, compression):
+    if compression is None:
+        yield raw
+
+    elif compression == "gzip":
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as binary:
+            yield binary
+
+    elif compression == "zstd":
+        # Optional dependency, imported only when zstd output is requested.
+        import zstandard
+
+        with zstandard.ZstdCompressor().stream_writer(raw, closefd=False) as binary:
+            yield binary
+
+    else:
+        raise ValueError(f'Unknown compression "{compression}".')
+
+
+def save_document(save_path, document, output_format, source=None, key_id=None):
+    """
+    Atomically write `document` next to `save_path` in `output_format` and
+    return the path written, which carries the format's suffix.
+    """
+    file_path = output_format.output_path(save_path)
+
+    with atomic_output(file_path, output_format) as stream:
+        write_document(stream, document, output_format, source, key_id)
+
+    return file_path
+
+
+def save_ndjson_part(folder, records):
+    """
+    Write NDJSON records, given as (document, source, key_id) tuples, to a
+    new part file in `folder` and return its path.
+
+    Batch workers write parts in parallel; join_parts() combines them.
+    """
+    fd, part_path = tempfile.mkstemp(suffix=NDJSON_PART_SUFFIX, dir=folder)
+    os.close(fd)
+
+    try:
+        with atomic_output(part_path, NDJSON_FORMAT) as stream:
+            for document, source, key_id in records:
+                write_document(stream, document, NDJSON_FORMAT, source, key_id)
+    except BaseException:
+        os.remove(part_path)
+        raise
+
+    return part_path
+
+
+def join_parts(file_path, part_paths):
+    """
+    Atomically write the NDJSON parts to `file_path` in order, then delete
+    them.
+    """
+    with atomic_output(file_path, NDJSON_FORMAT) as stream:
+        for part_path in part_paths:
+            with open(part_path, "r", encoding="utf-8", newline="") as f:
+                shutil.copyfileobj(f, stream)
+
+    for part_path in part_paths:
+        os.remove(part_path)
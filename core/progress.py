@@ -0,0 +1,25 @@
+import threading
+
+
+class OperationCancelled(Exception):
+    pass
+
+
+class CancellationToken:
+    """
+    Thread-safe flag checked between pipeline stages.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled("Operation cancelled.")
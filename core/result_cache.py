@@ -0,0 +1,310 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import json
+import os
+import sys
+import threading
+
+from config import RESULT_CACHE_DISK_MAX_BYTES, RESULT_CACHE_MAX_BYTES
+
+DIGEST_SIZE = 16
+DISK_SUFFIX = ".result"
+
+COUNTER_FIELDS = ("hits", "memory_hits", "disk_hits", "misses", "bytes_saved")
+
+
+@dataclass
+class CachedResult:
+    text: str
+    key_id: str | None
+    # blake2b of the access key the result was decrypted with, or "".
+    fingerprint: str
+    input_size: int
+
+    @property
+    def size(self):
+        return sys.getsizeof(self.text)
+
+
+def key_fingerprint(access_keys, key_id):
+    if key_id is None:
+        return ""
+
+    access_key = access_keys.get(key_id) or ""
+    return hashlib.blake2b(access_key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ResultCache:
+    """
+    Decrypted text of payloads seen before, keyed by a hash of the payload.
+
+    The memory tier is an LRU bounded by `max_bytes` of cached text. With
+    `disk_path`, results are also written there as one file per payload
+    and evicted oldest first once the folder exceeds `disk_max_bytes`.
+    Several processes may share a folder; each one enforces the budget
+    against the files it knows about, so the limit is approximate.
+
+    Entries remember which access key decrypted them and are dropped when
+    that key ID now maps to a different key.
+    """
+
+    def __init__(
+        self,
+        max_bytes=RESULT_CACHE_MAX_BYTES,
+        disk_path=None,
+        disk_max_bytes=RESULT_CACHE_DISK_MAX_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_entries = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        if disk_path is not None:
+            os.makedirs(disk_path, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def digest(content, key_id):
+        """
+        Return the cache key for `content` decrypted with `key_id`.
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+
+        hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        hasher.update(key_id.encode("utf-8") + b"\x00")
+        hasher.update(content)
+        return hasher.hexdigest()
+
+    def get(self, digest, access_keys):
+        """
+        Return the CachedResult for `digest`, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(digest)
+
+            if entry is not None:
+                if entry.fingerprint == key_fingerprint(access_keys, entry.key_id):
+                    self._entries.move_to_end(digest)
+                    self._record_hit(entry, "memory_hits")
+                    return entry
+
+                self._remove_memory_entry(digest)
+
+        entry = self._read_disk(digest, access_keys)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._record_hit(entry, "disk_hits")
+            self._store_memory_entry(digest, entry)
+            return entry
+
+    def put(self, digest, text, key_id, access_keys, input_size):
+        entry = CachedResult(
+            text, key_id, key_fingerprint(access_keys, key_id), input_size
+        )
+
+        with self._lock:
+            self._store_memory_entry(digest, entry)
+
+        if self.disk_path is not None:
+            self._write_disk(digest, entry)
+
+    def invalidate(self):
+        """
+        Drop the memory tier. Call this when the access key set changes;
+        disk entries are checked against the keys when they are read.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def counters(self):
+        with self._lock:
+            return {name: getattr(self, name) for name in COUNTER_FIELDS}
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                **{name: getattr(self, name) for name in COUNTER_FIELDS},
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    # ----------------- Memory Tier -----------------
+
+    def _record_hit(self, entry, tier):
+        self.hits += 1
+        setattr(self, tier, getattr(self, tier) + 1)
+        self.bytes_saved += entry.input_size
+
+    def _store_memory_entry(self, digest, entry):
+        if entry.size > self.max_bytes:
+            return
+
+        self._remove_memory_entry(digest)
+        self._entries[digest] = entry
+        self._bytes += entry.size
+
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def _remove_memory_entry(self, digest):
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    # ----------------- Disk Tier -----------------
+
+    def _disk_file(self, digest):
+        return os.path.join(self.disk_path, digest + DISK_SUFFIX)
+
+    def _scan_disk(self):
+        files = []
+
+        with os.scandir(self.disk_path) as scan:
+            for dir_entry in scan:
+                if dir_entry.name.endswith(DISK_SUFFIX) and dir_entry.is_file():
+                    stat = dir_entry.stat()
+                    files.append((stat.st_mtime, dir_entry.name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self._disk_entries[name[: -len(DISK_SUFFIX)]] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, digest, access_keys):
+        if self.disk_path is None:
+            return None
+
+        file_path = self._disk_file(digest)
+
+        try:
+            with open(file_path, "r", encoding="utf-8", newline="") as f:
+                header = json.loads(f.readline())
+                entry = CachedResult(
+                    f.read(),
+                    header["key_id"],
+                    header["fingerprint"],
+                    header["input_size"],
+                )
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            self._remove_disk_entry(digest)
+            return None
+
+        if entry.fingerprint != key_fingerprint(access_keys, entry.key_id):
+            self._remove_disk_entry(digest)
+            return None
+
+        try:
+            os.utime(file_path)
+        except OSError:
+            pass
+
+        with self._lock:
+            if digest in self._disk_entries:
+                self._disk_entries.move_to_end(digest)
+
+        return entry
+
+    def _write_disk(self, digest, entry):
+        header = {
+            "key_id": entry.key_id,
+            "fingerprint": entry.fingerprint,
+            "input_size": entry.input_size,
+        }
+        data = (json.dumps(header) + "\n" + entry.text).encode("utf-8")
+
+        if len(data) > self.disk_max_bytes:
+            return
+
+        file_path = self._disk_file(digest)
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, file_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(digest, 0)
+            self._disk_entries[digest] = len(data)
+            self._disk_bytes += len(data)
+
+            evicted = []
+            while self._disk_bytes > self.disk_max_bytes:
+                evicted_digest, size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(evicted_digest)
+
+        for evicted_digest in evicted:
+            try:
+                os.remove(self._disk_file(evicted_digest))
+            except OSError:
+                pass
+
+    def _remove_disk_entry(self, digest):
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(digest, 0)
+
+        try:
+            os.remove(self._disk_file(digest))
+        except OSError:
+            pass
+
+
+def counters_delta(before, after):
+    return {name: after[name] - before[name] for name in COUNTER_FIELDS}
+
+
+def merge_counters(counters):
+    """
+    Add several counters() results together, e.g. from batch workers.
+    """
+    merged = dict.fromkeys(COUNTER_FIELDS, 0)
+
+    for counter in counters:
+        for name in COUNTER_FIELDS:
+            merged[name] += counter[name]
+
+    return merged
+
+
+def format_counters(counters):
+    lookups = counters["hits"] + counters["misses"]
+    hit_rate = counters["hits"] / lookups if lookups else 0.0
+
+    return (
+        f"{counters['hits']}/{lookups} lookups hit ({hit_rate:.0%}; "
+        f"{counters['memory_hits']} memory, {counters['disk_hits']} disk), "
+        f"{counters['bytes_saved'] / (1024 * 1024):.1f} MB not decrypted again"
+    )
@@ -0,0 +1,87 @@
+import importlib.util
+
+# ==================
+# Translation Tables
+# ==================
+
+SHIFT_UP_TABLE = bytes((byte + 1) % 256 for byte in range(256))
+SHIFT_DOWN_TABLE = bytes((byte - 1) % 256 for byte in range(256))
+
+TERMINATOR = b"\x00"
+
+# ==================
+# Backends
+# ==================
+
+BACKENDS = ("table", "numpy")
+
+_backend = "table"
+_numpy = None
+
+
+def set_backend(name):
+    """
+    Select the implementation used by shift_up/shift_down.
+
+    "table" uses bytes.translate and is always available.
+    "numpy" requires NumPy to be installed.
+    """
+    global _backend
+
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown shift backend "{name}".')
+
+    if name == "numpy" and importlib.util.find_spec("numpy") is None:
+        raise ValueError("NumPy is not installed.")
+
+    _backend = name
+
+
+def get_backend():
+    return _backend
+
+
+def _load_numpy():
+    global _numpy
+
+    if _numpy is None:
+        import numpy
+
+        _numpy = numpy
+
+    return _numpy
+
+
+def _translate(data, table, delta):
+    if _backend == "numpy":
+        np = _load_numpy()
+        array = np.frombuffer(data, dtype=np.uint8)
+        return (array + np.uint8(delta % 256)).tobytes()
+
+    return bytes(data).translate(table)
+
+
+# ==================
+# Shift Helpers
+# ==================
+
+
+def shift_up(data):
+    return _translate(data, SHIFT_UP_TABLE, 1)
+
+
+def shift_down(data):
+    return _translate(data, SHIFT_DOWN_TABLE, -1)
+
+
+def shift_up_until_terminator(data):
+    """
+    Shift bytes up by one, stopping at the first zero byte.
+
+    Returns a memoryview that excludes the terminator and anything after it,
+    so the shifted buffer is not copied again to trim the padding.
+    """
+    end = data.find(TERMINATOR)
+    shifted = memoryview(shift_up(data))
+
+    return shifted if end == -1 else shifted[:end]
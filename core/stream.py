@@ -0,0 +1,220 @@
+import binascii
+import codecs
+import itertools
+import re
+import sys
+import zlib
+
+from core.shift import shift_up
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+AES_BLOCK_SIZE = 16
+ZLIB_SIZE_HEADER_LENGTH = 4
+
+_NON_BASE64_PATTERN = re.compile(rb"[^A-Za-z0-9+/=]")
+
+# ==================
+# Chunk Helpers
+# ==================
+
+
+def read_chunks(source, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield ASCII byte chunks from a readable file-like object.
+
+    Text sources are encoded to ASCII as they are read.
+    """
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+
+        if isinstance(chunk, str):
+            chunk = chunk.encode("ascii")
+
+        yield chunk
+
+
+class BufferReader:
+    """
+    Read data[start:end] of a bytes-like object, such as a memory map, as a
+    file-like source.
+
+    Only the chunk being read is copied. Call release() before closing the
+    underlying buffer.
+    """
+
+    def __init__(self, data, start=0, end=None):
+        self._view = memoryview(data)
+        self._position = start
+        self._end = len(self._view) if end is None else end
+
+    def read(self, size=-1):
+        end = self._end if size < 0 else min(self._position + size, self._end)
+        chunk = bytes(self._view[self._position : end])
+        self._position += len(chunk)
+        return chunk
+
+    def release(self):
+        self._view.release()
+
+
+def _join(buffered):
+    return buffered[0][:0].join(buffered)
+
+
+def peek(chunks, size):
+    """
+    Return the first `size` items of a chunk stream and an equivalent stream.
+    """
+    chunks = iter(chunks)
+    buffered = []
+    buffered_length = 0
+
+    for chunk in chunks:
+        buffered.append(chunk)
+        buffered_length += len(chunk)
+        if buffered_length >= size:
+            break
+
+    if not buffered:
+        return None, iter(())
+
+    joined = _join(buffered)
+    return joined[:size], itertools.chain([joined], chunks)
+
+
+def take(chunks, size):
+    """
+    Split a chunk stream into its first `size` items and the remaining stream.
+    """
+    head, chunks = peek(chunks, size)
+    if head is None:
+        return None, chunks
+
+    joined = next(chunks)
+    return head, itertools.chain([joined[size:]], chunks)
+
+
+# ==================
+# Pipeline Stages
+# ==================
+
+
+def iter_base64_decode(chunks):
+    pending = b""
+
+    for chunk in chunks:
+        pending += _NON_BASE64_PATTERN.sub(b"", chunk)
+        usable_length = len(pending) - len(pending) % 4
+
+        if usable_length:
+            yield binascii.a2b_base64(pending[:usable_length])
+            pending = pending[usable_length:]
+
+    if pending:
+        yield binascii.a2b_base64(pending)
+
+
+def iter_aes_decrypt(chunks, cipher):
+    pending = b""
+
+    for chunk in chunks:
+        pending += chunk
+        usable_length = len(pending) - len(pending) % AES_BLOCK_SIZE
+
+        if usable_length:
+            yield cipher.decrypt(pending[:usable_length])
+            pending = pending[usable_length:]
+
+    if pending:
+        # Raises the same alignment error as a one-shot decrypt would.
+        yield cipher.decrypt(pending)
+
+
+def iter_shift_until_terminator(chunks):
+    for chunk in chunks:
+        end = chunk.find(b"\x00")
+
+        if end == -1:
+            yield shift_up(chunk)
+            continue
+
+        if end:
+            yield shift_up(chunk[:end])
+        return
+
+
+def iter_inflate(chunks, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Inflate a size-prefixed zlib stream, bounding each output chunk.
+
+    The 4-byte little-endian size header is checked once the stream ends.
+    """
+    size_header, chunks = take(chunks, ZLIB_SIZE_HEADER_LENGTH)
+
+    if size_header is None or len(size_header) < ZLIB_SIZE_HEADER_LENGTH:
+        raise ValueError("Invalid zlib payload.")
+
+    expected_size = int.from_bytes(size_header, "little")
+
+    decompressor = zlib.decompressobj()
+    inflated_length = 0
+
+    for chunk in chunks:
+        data = chunk
+
+        while data and not decompressor.eof:
+            inflated = decompressor.decompress(data, chunk_size)
+            inflated_length += len(inflated)
+
+            if inflated:
+                yield inflated
+
+            data = decompressor.unconsumed_tail
+
+    inflated = decompressor.flush()
+    inflated_length += len(inflated)
+
+    if inflated:
+        yield inflated
+
+    if not decompressor.eof:
+        raise ValueError("Truncated zlib payload.")
+
+    if inflated_length != expected_size:
+        raise ValueError(
+            f"Zlib size mismatch. Expected {expected_size}, got {inflated_length}."
+        )
+
+
+def iter_utf16_decode(chunks):
+    bom, chunks = peek(chunks, 2)
+
+    if bom in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        encoding = "utf-16"
+    else:
+        # Matches bytes.decode("utf-16"), which assumes native order without a BOM.
+        encoding = "utf-16-le" if sys.byteorder == "little" else "utf-16-be"
+
+    decoder = codecs.getincrementaldecoder(encoding)()
+
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def iter_ascii_decode(chunks):
+    for chunk in chunks:
+        yield chunk.decode("ascii")
+
+
+def iter_ascii_encode(chunks):
+    for chunk in chunks:
+        yield chunk.encode("ascii")
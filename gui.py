@@ -1,29 +1,60 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
 import json
+import mmap
 import os
 import sys
 
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import QEvent, QObject, QRunnable, Qt, QThreadPool, pyqtSignal
 from PyQt6.QtGui import QColor, QIcon, QTextCharFormat, QTextCursor
 from PyQt6.QtWidgets import (
     QApplication,
+    QCheckBox,
     QComboBox,
     QFileDialog,
     QGroupBox,
     QHBoxLayout,
+    QPlainTextEdit,
     QPushButton,
     QRadioButton,
+    QStackedWidget,
     QTextEdit,
+    QTreeView,
     QVBoxLayout,
     QWidget,
 )
 
-from config import DataPrefixes
-from utils import version_to_tuple
+from config import AUTO_KEY_ID
+from utils import (
+    build_output_path,
+    close_input_file,
+    extract_dbd_payload,
+    fetch_access_keys,
+    is_dbd_payload,
+    KeyStore,
+    UnknownKeyIdError,
+    as_key_ring,
+    nested_map_path,
+    read_input_file,
+    unwrap_payload,
+)
+from core.cipher_cache import default_cipher_cache
 from core.decrypter import DBDDecrypter
-from core.encrypter import DBDEncrypter
+from core.document import JsonDocument
+from core.encrypter import DBDEncrypter, MultiEncryptResult
+from core.instrumentation import StageRecorder, format_summary
+from core.nested import nested_map_from_json, nested_map_to_json
+from core.output import (
+    OUTPUT_FORMATS,
+    atomic_output,
+    save_document,
+    write_document,
+    zstd_available,
+)
+from core.progress import CancellationToken, OperationCancelled
+from core.result_cache import ResultCache, format_counters
+from json_tree import JsonTreeModel
 
 # ----------------- Utilities -----------------
 def resource_path(relative_path):
@@ -44,66 +75,235 @@ def load_stylesheet(path):
     return stylesheet
 
 
-PAYLOAD_PREFIXES = (
-    DataPrefixes.CLIENT_DATA,
-    DataPrefixes.FULL_PROFILE,
-    DataPrefixes.ZLIB,
-)
+# Save Output formats, keyed by their OUTPUT_FORMATS name.
+OUTPUT_FORMAT_LABELS = {
+    "pretty": "Pretty JSON",
+    "compact": "Compact JSON",
+    "gzip": "JSON (gzip)",
+    "zstd": "JSON (zstd)",
+    "ndjson": "NDJSON",
+}
 
 
-def is_dbd_payload(text):
-    return text.startswith(PAYLOAD_PREFIXES)
+# ----------------- Enums / State -----------------
+class Mode(Enum):
+    DECRYPT = "decrypt"
+    ENCRYPT = "encrypt"
 
 
-def extract_dbd_payload(text):
-    if not text:
-        return text
+@dataclass
+class LoadedFileState:
+    data: str | bytes | mmap.mmap | None = None
+    file_path: str | None = None
 
-    payload_start = None
 
-    for prefix in PAYLOAD_PREFIXES:
-        index = text.find(prefix)
-        if index == -1:
-            continue
-        payload_start = index if payload_start is None else min(payload_start, index)
+# ----------------- Workers -----------------
+STAGE_LABELS = {
+    "base64": "Base64",
+    "aes": "AES",
+    "zlib": "Zlib",
+    "json": "JSON validation",
+    "nested": "Nested payloads",
+    "cache": "Cached result",
+}
 
-    return text[payload_start:] if payload_start is not None else text
 
+@dataclass
+class TaskResult:
+    document: JsonDocument
+    key_id: str | None
+    parse_count: int
+    stage_summary: dict | None = None
+    # JSON Pointer -> NestedPayload, set by deep decrypt.
+    nested: dict = field(default_factory=dict)
+    nested_errors: dict = field(default_factory=dict)
+    # Set when one document was encrypted for several key IDs.
+    multi: MultiEncryptResult | None = None
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def emit_safely(self, signal_name, *values):
+        # The window may close while a worker is still running.
+        try:
+            getattr(self, signal_name).emit(*values)
+        except RuntimeError:
+            pass
 
-def pretty_print_json(text):
-    try:
-        return json.dumps(json.loads(text), indent=4)
-    except json.JSONDecodeError:
-        return text
 
+class KeyLoader(QRunnable):
+    def __init__(self):
+        super().__init__()
+        self.signals = WorkerSignals()
 
-def key_id_to_version_tuple(key_id):
-    try:
-        version = key_id.split("_", 1)[0]
-        return version_to_tuple(version)
-    except ValueError:
-        return (0, 0, 0)
+    def run(self):
+        try:
+            access_keys = fetch_access_keys()
+        except Exception as e:
+            self.signals.emit_safely("failed", str(e))
+            return
 
+        self.signals.emit_safely("finished", access_keys)
+
+
+class CryptoTask(QRunnable):
+    def __init__(
+        self,
+        mode,
+        data,
+        key_id,
+        access_keys,
+        record_stages=False,
+        deep=False,
+        nested=None,
+        result_cache=None,
+        key_store=None,
+        key_ids=None,
+    ):
+        super().__init__()
+        self.mode = mode
+        self.data = data
+        self.key_id = key_id
+        self.access_keys = access_keys
+        self.stage_recorder = StageRecorder() if record_stages else None
+        # Decrypt: follow nested payloads. Encrypt: the map to restore.
+        self.deep = deep
+        self.nested = nested
+        self.result_cache = result_cache
+        # Refreshed once and the task retried when a key ID is unknown.
+        self.key_store = key_store
+        # Encrypt for all of these key IDs; `key_id` is the one displayed.
+        self.key_ids = key_ids
+        self.cancellation = CancellationToken()
+        self.signals = WorkerSignals()
+
+    def cancel(self):
+        self.cancellation.cancel()
+
+    def report_progress(self, stage):
+        self.cancellation.raise_if_cancelled()
+        self.signals.emit_safely("progress", stage)
+
+    def run(self):
+        signal_name, *values = self.run_with_retry()
+
+        # Drop the input before reporting back, so a memory-mapped file can
+        # be closed as soon as the GUI hears that the task ended.
+        self.data = None
+        self.signals.emit_safely(signal_name, *values)
+
+    def run_with_retry(self):
+        try:
+            try:
+                task_result = self.run_mode()
+            except UnknownKeyIdError as e:
+                # Keys may have been published since they were last loaded.
+                if self.key_store is None or not self.key_store.refresh_for_unknown(
+                    e.key_id
+                ):
+                    raise
+
+                self.access_keys = self.key_store.key_ring
+                if self.stage_recorder is not None:
+                    self.stage_recorder = StageRecorder()
+                task_result = self.run_mode()
+
+        except OperationCancelled:
+            return ("cancelled",)
 
-# ----------------- Enums / State -----------------
-class Mode(Enum):
-    DECRYPT = "decrypt"
-    ENCRYPT = "encrypt"
+        except Exception as e:
+            return ("failed", str(e))
+
+        if self.stage_recorder is not None:
+            task_result.stage_summary = self.stage_recorder.summary()
+
+        return ("finished", task_result)
+
+    def run_mode(self):
+        if self.mode is Mode.DECRYPT:
+            decrypter = DBDDecrypter(
+                self.access_keys,
+                progress=self.report_progress,
+                instrumentation=self.stage_recorder,
+                result_cache=self.result_cache,
+            )
+            if self.deep:
+                decrypt_result = decrypter.decrypt_deep(self.data, self.key_id)
+                nested = decrypt_result.nested
+                nested_errors = decrypt_result.errors
+            else:
+                decrypt_result = decrypter.decrypt_result(self.data, self.key_id)
+                nested, nested_errors = {}, {}
+
+            return TaskResult(
+                decrypt_result.document,
+                decrypt_result.key_id,
+                decrypt_result.document.parse_count,
+                nested=nested,
+                nested_errors=nested_errors,
+            )
+
+        # Mode.ENCRYPT
+        input_document = JsonDocument(self.data)
+
+        self.report_progress("json")
+        if input_document.is_blank or not input_document.is_valid():
+            raise ValueError("Encryption input must be valid JSON.")
+
+        encrypter = DBDEncrypter(
+            self.access_keys,
+            progress=self.report_progress,
+            instrumentation=self.stage_recorder,
+        )
+        plaintext = input_document
+        if self.nested:
+            plaintext = encrypter.restore_nested(input_document, self.nested)
+
+        multi = None
+        if self.key_ids and len(self.key_ids) > 1:
+            multi = encrypter.encrypt_many(plaintext, self.key_ids)
+            encrypted = multi.payloads[self.key_id]
+        else:
+            encrypted = encrypter.encrypt(plaintext, self.key_id)
+
+        return TaskResult(
+            JsonDocument(encrypted),
+            self.key_id,
+            input_document.parse_count,
+            nested=self.nested or {},
+            multi=multi,
+        )
 
 
-@dataclass
-class LoadedFileState:
-    data: str | None = None
-    file_path: str | None = None
+class FirstPaintFilter(QObject):
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Type.Paint and self.callback is not None:
+            callback, self.callback = self.callback, None
+            callback()
+        return False
 
 
 # ----------------- GUI -----------------
-def run_gui(access_keys):
+def run_gui(access_keys, on_first_paint=None):
     icon_path = resource_path("icons/app_icon.ico")
 
+    access_keys = as_key_ring(access_keys)
+    key_store = KeyStore(access_keys)
+
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon(icon_path))
 
+    # Decrypting the same payload again in this session skips the pipeline.
+    result_cache = ResultCache()
+
     window = QWidget()
     window.setWindowTitle("DBD Crypter v3.1.0")
     window.setWindowIcon(QIcon(icon_path))
@@ -122,13 +322,15 @@ def run_gui(access_keys):
 
     # State
     loaded_file = LoadedFileState()
+    released_files = []
     last_run_mode: Mode | None = None
     last_run_input_path: str | None = None
-    last_result: str | None = None
-
-    # Crypto
-    decrypter = DBDDecrypter(access_keys)
-    encrypter = DBDEncrypter(access_keys)
+    last_result: JsonDocument | None = None
+    last_nested: dict = {}
+    last_multi: MultiEncryptResult | None = None
+    last_key_id: str | None = None
+    key_loader: KeyLoader | None = None
+    crypto_task: CryptoTask | None = None
 
     # ----------------- Layouts -----------------
     main_layout = QHBoxLayout()
@@ -170,8 +372,10 @@ def run_gui(access_keys):
     key_id_selection_group = QGroupBox("Key ID")
     key_id_selection_combo = QComboBox()
     key_id_selection_combo.setEnabled(False)
-    key_id_selection_layout = QVBoxLayout()
-    key_id_selection_layout.addWidget(key_id_selection_combo)
+    refresh_keys_button = QPushButton("Refresh Keys")
+    key_id_selection_layout = QHBoxLayout()
+    key_id_selection_layout.addWidget(key_id_selection_combo, 1)
+    key_id_selection_layout.addWidget(refresh_keys_button)
     key_id_selection_group.setLayout(key_id_selection_layout)
     control_panel_layout.addWidget(key_id_selection_group)
 
@@ -186,31 +390,78 @@ def run_gui(access_keys):
     status_group.setLayout(status_layout)
     control_panel_layout.addWidget(status_group)
 
+    # Options Group
+    options_group = QGroupBox("Options")
+    deep_checkbox = QCheckBox("Deep")
+    deep_checkbox.setToolTip(
+        "Decrypt: also decrypt payloads nested inside the JSON.\n"
+        "Encrypt: re-encrypt them using the map saved next to the file."
+    )
+    all_branches_checkbox = QCheckBox("All branches")
+    all_branches_checkbox.setToolTip(
+        "Encrypt: also encrypt for every other key ID of the same version,\n"
+        "e.g. live, ptb and stage. The text is compressed only once."
+    )
+    stage_timings_checkbox = QCheckBox("Stage timings")
+    stage_timings_checkbox.setToolTip("Log how long each pipeline stage took")
+    options_layout = QHBoxLayout()
+    options_layout.addWidget(deep_checkbox)
+    options_layout.addWidget(all_branches_checkbox)
+    options_layout.addWidget(stage_timings_checkbox)
+    options_group.setLayout(options_layout)
+    control_panel_layout.addWidget(options_group)
+
     # Run Button Layout
     run_button = QPushButton("Run")
     run_button.setEnabled(False)
-    run_button.setFixedWidth(306)
+    run_button.setFixedWidth(200)
+    cancel_button = QPushButton("Cancel")
+    cancel_button.setEnabled(False)
+    cancel_button.setFixedWidth(100)
     run_button_layout = QHBoxLayout()
     run_button_layout.setContentsMargins(0, 0, 0, 9)
     run_button_layout.addWidget(run_button)
+    run_button_layout.addWidget(cancel_button)
     control_panel_layout.addSpacing(-8)
     control_panel_layout.addLayout(run_button_layout)
 
     # Output Group
     output_group = QGroupBox("Output")
-    output_text_edit = QTextEdit()
+    output_tree_view = QTreeView()
+    output_tree_view.setUniformRowHeights(True)
+    output_text_edit = QPlainTextEdit()
     output_text_edit.setReadOnly(True)
+    output_stack = QStackedWidget()
+    output_stack.addWidget(output_text_edit)
+    output_stack.addWidget(output_tree_view)
     output_layout = QVBoxLayout()
-    output_layout.addWidget(output_text_edit)
+    output_layout.addWidget(output_stack)
 
     # Output Buttons Layout
     copy_output_button = QPushButton("Copy Output")
     save_output_button = QPushButton("Save Output")
     copy_output_button.setEnabled(False)
     save_output_button.setEnabled(False)
+    output_format_combo = QComboBox()
+    output_format_combo.setToolTip(
+        "Format used by Save Output. Compact and compressed JSON are smaller\n"
+        "and faster to write than pretty JSON."
+    )
+    for format_name, format_label in OUTPUT_FORMAT_LABELS.items():
+        output_format_combo.addItem(format_label, format_name)
+    if not zstd_available():
+        # Optional dependency; the item stays visible so the option is discoverable.
+        zstd_index = output_format_combo.findData("zstd")
+        output_format_combo.model().item(zstd_index).setEnabled(False)
+        output_format_combo.setItemData(
+            zstd_index,
+            "Requires the zstandard package: pip install zstandard",
+            Qt.ItemDataRole.ToolTipRole,
+        )
     output_buttons_layout = QHBoxLayout()
     output_buttons_layout.addWidget(copy_output_button)
     output_buttons_layout.addWidget(save_output_button)
+    output_buttons_layout.addWidget(output_format_combo)
     output_layout.addLayout(output_buttons_layout)
     output_group.setLayout(output_layout)
 
@@ -244,24 +495,21 @@ def run_gui(access_keys):
     def get_input_data():
         if loaded_file.data is not None:
             return loaded_file.data
-        return input_text_edit.toPlainText().strip()
+        return unwrap_payload(input_text_edit.toPlainText().strip())
 
     def populate_key_ids():
         key_id_selection_combo.blockSignals(True)
 
         try:
+            selected_key_id = key_id_selection_combo.currentText()
             key_id_selection_combo.clear()
 
             key_ids = list(access_keys.keys())
+            key_id_selection_combo.addItem(AUTO_KEY_ID)
             key_id_selection_combo.addItems(key_ids)
 
-            live_key_ids = [key_id for key_id in key_ids if key_id.endswith("_live")]
-            if live_key_ids:
-                latest_live_key_id = max(live_key_ids, key=key_id_to_version_tuple)
-                index = key_id_selection_combo.findText(latest_live_key_id)
-                key_id_selection_combo.setCurrentIndex(index if index >= 0 else 0)
-            else:
-                key_id_selection_combo.setCurrentIndex(0)
+            index = key_id_selection_combo.findText(selected_key_id)
+            key_id_selection_combo.setCurrentIndex(index if index >= 0 else 0)
 
         finally:
             key_id_selection_combo.blockSignals(False)
@@ -269,7 +517,7 @@ def run_gui(access_keys):
     def update_ui():
         has_file = loaded_file.data is not None
         has_text = bool(input_text_edit.toPlainText().strip())
-        has_output = bool(output_text_edit.toPlainText().strip())
+        has_output = last_result is not None and bool(last_result.text)
         mode = current_mode()
 
         input_text_edit.blockSignals(True)
@@ -292,18 +540,96 @@ def run_gui(access_keys):
         finally:
             input_text_edit.blockSignals(False)
 
-        ready_to_run = (mode is Mode.DECRYPT and (has_file or has_text)) or (
+        has_input = (mode is Mode.DECRYPT and (has_file or has_text)) or (
             mode is Mode.ENCRYPT and has_file
         )
+        is_running = crypto_task is not None
+        ready_to_run = has_input and bool(access_keys) and not is_running
 
         key_id_selection_combo.setEnabled(ready_to_run)
         run_button.setEnabled(ready_to_run)
+        cancel_button.setEnabled(is_running and not crypto_task.cancellation.cancelled)
+        refresh_keys_button.setEnabled(key_loader is None)
         clear_file_button.setEnabled(has_file)
 
         copy_output_button.setEnabled(has_output)
         save_output_button.setEnabled(has_output)
 
+    def show_output(document, mode):
+        previous_model = output_tree_view.model()
+
+        if mode is Mode.DECRYPT and not document.is_blank:
+            output_tree_view.setModel(JsonTreeModel(document.value, output_tree_view))
+            output_tree_view.setColumnWidth(0, 250)
+            output_text_edit.clear()
+            output_stack.setCurrentWidget(output_tree_view)
+        else:
+            output_tree_view.setModel(None)
+            output_text_edit.setPlainText(document.text)
+            output_stack.setCurrentWidget(output_text_edit)
+
+        if previous_model is not None:
+            previous_model.deleteLater()
+
+    def load_access_keys():
+        nonlocal key_loader
+
+        if key_loader is not None:
+            return
+
+        append_status("Loading access keys...", QColor("#e0e0e0"))
+
+        key_loader = KeyLoader()
+        key_loader.signals.finished.connect(on_keys_loaded)
+        key_loader.signals.failed.connect(on_keys_failed)
+        QThreadPool.globalInstance().start(key_loader)
+
+        update_ui()
+
     # ----------------- Event Handlers -----------------
+    def apply_key_ring(key_ring):
+        nonlocal access_keys
+
+        # Running tasks keep the ring they started with.
+        access_keys = key_ring
+        default_cipher_cache.invalidate()
+        result_cache.invalidate()
+        populate_key_ids()
+
+    def on_key_ring_changed(key_ring):
+        apply_key_ring(key_ring)
+        append_status(
+            f"Access keys updated: {len(access_keys)} key IDs.", QColor("#4caf50")
+        )
+        update_ui()
+
+    def on_keys_loaded(loaded_keys):
+        nonlocal key_loader
+
+        key_loader = None
+
+        if loaded_keys:
+            key_store.replace(loaded_keys)
+            apply_key_ring(key_store.key_ring)
+            append_status(
+                f"Access keys loaded: {len(access_keys)} key IDs.", QColor("#4caf50")
+            )
+        elif access_keys:
+            append_status(
+                "Failed to refresh access keys. Using cached keys.", QColor("#ffa500")
+            )
+        else:
+            append_status("No access keys available.", QColor("#ff5555"))
+
+        update_ui()
+
+    def on_keys_failed(message):
+        nonlocal key_loader
+
+        key_loader = None
+        append_status(f"Failed to load access keys: {message}", QColor("#ff5555"))
+        update_ui()
+
     def on_load_file():
         file_path, _ = QFileDialog.getOpenFileName(
             window, "Load File", "", "JSON Files (*.json)"
@@ -316,33 +642,47 @@ def run_gui(access_keys):
 
         try:
             if mode is Mode.DECRYPT:
-                with open(file_path, "rb") as f:
-                    raw_bytes = f.read()
-                content = raw_bytes.decode("utf-8", errors="replace")
+                content = read_input_file(file_path)
 
             else:  # Mode.ENCRYPT
                 with open(file_path, "r", encoding="utf-8") as f:
                     content = f.read()
 
+            release_loaded_file()
             loaded_file.data = content
             loaded_file.file_path = file_path
             append_status(f"File loaded: {file_path}", QColor("#4caf50"))
 
         except Exception as e:
-            loaded_file.data = None
-            loaded_file.file_path = None
+            release_loaded_file()
             append_status(f"Failed to load file: {e}", QColor("#ff5555"))
 
         update_ui()
 
-    def on_clear_file():
+    def release_loaded_file():
+        # Large files are memory-mapped; a running task may still be reading
+        # the map, in which case it is closed when the task ends.
+        released_files.append(loaded_file.data)
         loaded_file.data = None
         loaded_file.file_path = None
+
+        if crypto_task is None:
+            close_released_files()
+
+    def close_released_files():
+        while released_files:
+            close_input_file(released_files.pop())
+
+    def on_clear_file():
+        release_loaded_file()
         append_status("File cleared. Input re-enabled.", QColor("#ffa500"))
         update_ui()
 
     def on_run_clicked():
-        nonlocal last_run_mode, last_run_input_path, last_result
+        nonlocal crypto_task
+
+        if crypto_task is not None:
+            return
 
         mode = current_mode()
 
@@ -358,50 +698,185 @@ def run_gui(access_keys):
             append_status("Encryption requires a loaded file.", QColor("#ff5555"))
             return
 
-        try:
-            if mode is Mode.DECRYPT:
-                data = extract_dbd_payload(data)
+        if mode is Mode.ENCRYPT and key_id == AUTO_KEY_ID:
+            key_id = access_keys.latest()
+            if key_id is None:
+                append_status("No live key ID available.", QColor("#ff5555"))
+                return
+            append_status(f"Using key ID: {key_id}", QColor("#e0e0e0"))
 
-                if not is_dbd_payload(data):
-                    append_status(
-                        "Input is already decrypted or is in an invalid format.",
-                        QColor("#ff5555"),
-                    )
-                    return
+        if mode is Mode.DECRYPT:
+            data = extract_dbd_payload(data)
 
-                result = decrypter.decrypt(data, key_id)
+            if not is_dbd_payload(data):
+                append_status(
+                    "Input is already decrypted or is in an invalid format.",
+                    QColor("#ff5555"),
+                )
+                return
 
-            else:  # Mode.ENCRYPT
-                if is_dbd_payload(data):
-                    append_status(
-                        "Input is already encrypted or is in an invalid format.",
-                        QColor("#ff5555"),
-                    )
-                    return
-
-                try:
-                    json.loads(data)
-                except json.JSONDecodeError:
-                    append_status(
-                        "Encryption input must be valid JSON.",
-                        QColor("#ff5555"),
-                    )
-                    return
+        elif is_dbd_payload(data):
+            append_status(
+                "Input is already encrypted or is in an invalid format.",
+                QColor("#ff5555"),
+            )
+            return
 
-                result = encrypter.encrypt(data, key_id)
+        elif not isinstance(data, str):
+            # Files loaded in Decrypt mode are kept as bytes or a memory map.
+            data = str(data, "utf-8", errors="replace")
 
-        except Exception as e:
-            append_status(f"{action} failed: {e}", QColor("#ff5555"))
-            return
+        key_ids = None
+
+        if mode is Mode.ENCRYPT and all_branches_checkbox.isChecked():
+            key_ids = access_keys.for_version(access_keys.version(key_id))
+            append_status(
+                f"Encrypting for {len(key_ids)} key IDs: {', '.join(key_ids)}",
+                QColor("#e0e0e0"),
+            )
+
+        nested = None
+
+        if mode is Mode.ENCRYPT and deep_checkbox.isChecked():
+            map_path = nested_map_path(loaded_file.file_path)
+
+            try:
+                with open(map_path, "r", encoding="utf-8") as f:
+                    nested = nested_map_from_json(json.load(f))
+            except FileNotFoundError:
+                append_status(
+                    f"No nested payload map found at {map_path}; encrypting as is.",
+                    QColor("#ffa500"),
+                )
+            except ValueError as e:
+                append_status(f"Failed to read nested payload map: {e}", QColor("#ff5555"))
+                return
+            else:
+                append_status(
+                    f"Restoring {len(nested)} nested payloads from {map_path}",
+                    QColor("#e0e0e0"),
+                )
+
+        crypto_task = CryptoTask(
+            mode,
+            data,
+            key_id,
+            access_keys,
+            record_stages=stage_timings_checkbox.isChecked(),
+            deep=mode is Mode.DECRYPT and deep_checkbox.isChecked(),
+            nested=nested,
+            result_cache=result_cache,
+            key_store=key_store,
+            key_ids=key_ids,
+        )
+        crypto_task.signals.progress.connect(on_task_progress)
+        crypto_task.signals.finished.connect(on_task_finished)
+        crypto_task.signals.failed.connect(on_task_failed)
+        crypto_task.signals.cancelled.connect(on_task_cancelled)
+        QThreadPool.globalInstance().start(crypto_task)
+
+        append_status(f"{action} started.", QColor("#e0e0e0"))
+        update_ui()
+
+    def on_task_progress(stage):
+        append_status(f"Stage: {STAGE_LABELS.get(stage, stage)}", QColor("#e0e0e0"))
+
+    def on_task_finished(task_result):
+        nonlocal crypto_task, last_run_mode, last_run_input_path, last_result
+        nonlocal last_nested, last_multi, last_key_id
+
+        result = task_result.document
+        used_key_id = task_result.key_id
+        mode = crypto_task.mode
+        crypto_task = None
+        close_released_files()
+
+        action = "Decryption" if mode is Mode.DECRYPT else "Encryption"
 
-        last_result = pretty_print_json(result)
+        if mode is Mode.DECRYPT and used_key_id is not None:
+            append_status(f"Decrypted with key ID: {used_key_id}", QColor("#e0e0e0"))
+
+        if mode is Mode.DECRYPT and task_result.nested:
+            append_status(
+                f"Decrypted {len(task_result.nested)} nested payloads:",
+                QColor("#e0e0e0"),
+            )
+            for nested_payload in task_result.nested.values():
+                append_status(
+                    f"  {nested_payload.path} [{nested_payload.key_id or nested_payload.prefix}]",
+                    QColor("#a0a0a0"),
+                )
+
+        for path, message in task_result.nested_errors.items():
+            append_status(f"  {path} left encrypted: {message}", QColor("#ffa500"))
+
+        last_result = result
+        last_nested = task_result.nested if mode is Mode.DECRYPT else {}
+        last_multi = task_result.multi
+        last_key_id = task_result.key_id
         last_run_mode = mode
         last_run_input_path = loaded_file.file_path
 
-        output_text_edit.setPlainText(last_result)
+        show_output(result, mode)
+
+        append_status(
+            f"{action} completed successfully (JSON parsed {task_result.parse_count}x).",
+            QColor("#4caf50"),
+        )
+
+        if task_result.stage_summary:
+            append_status("Stage timings:", QColor("#e0e0e0"))
+            for line in format_summary(task_result.stage_summary):
+                append_status(line, QColor("#a0a0a0"))
+
+        if mode is Mode.DECRYPT and result_cache.hits:
+            append_status(
+                f"Result cache: {format_counters(result_cache.counters())}",
+                QColor("#a0a0a0"),
+            )
+
+        if task_result.multi:
+            multi = task_result.multi
+            for multi_key_id, payload in multi.payloads.items():
+                append_status(
+                    f"  {multi_key_id}: {len(payload):,} characters",
+                    QColor("#a0a0a0"),
+                )
+            append_status(
+                f"Encrypted for {len(multi.payloads)} key IDs; shared stages ran once "
+                f"({multi.shared_seconds * 1000:.1f} ms), saving about "
+                f"{multi.saved_seconds * 1000:.1f} ms.",
+                QColor("#e0e0e0"),
+            )
+
+        update_ui()
+
+    def on_task_failed(message):
+        nonlocal crypto_task
+
+        action = "Decryption" if crypto_task.mode is Mode.DECRYPT else "Encryption"
+        crypto_task = None
+        close_released_files()
+
+        append_status(f"{action} failed: {message}", QColor("#ff5555"))
+        update_ui()
+
+    def on_task_cancelled():
+        nonlocal crypto_task
+
+        action = "Decryption" if crypto_task.mode is Mode.DECRYPT else "Encryption"
+        crypto_task = None
+        close_released_files()
 
-        append_status(f"{action} completed successfully.", QColor("#4caf50"))
+        append_status(f"{action} cancelled.", QColor("#ffa500"))
+        update_ui()
+
+    def on_cancel_clicked():
+        if crypto_task is None:
+            return
 
+        crypto_task.cancel()
+        append_status("Cancelling...", QColor("#ffa500"))
         update_ui()
 
     def on_copy_output():
@@ -409,7 +884,7 @@ def run_gui(access_keys):
             append_status("No output to copy.", QColor("#ff5555"))
             return
 
-        QApplication.clipboard().setText(last_result)
+        QApplication.clipboard().setText(last_result.pretty())
         append_status("Output copied to clipboard.", QColor("#4caf50"))
 
     def on_save_output():
@@ -417,32 +892,62 @@ def run_gui(access_keys):
             append_status("No output to save.", QColor("#ff5555"))
             return
 
-        folder = os.path.join(
-            os.getcwd(),
-            "Output",
-            "Decrypted" if last_run_mode is Mode.DECRYPT else "Encrypted",
-        )
+        output_format = OUTPUT_FORMATS[output_format_combo.currentData()]
+        subfolder = "Decrypted" if last_run_mode is Mode.DECRYPT else "Encrypted"
 
-        os.makedirs(folder, exist_ok=True)
+        try:
+            if last_run_mode is Mode.ENCRYPT and last_multi and output_format.ndjson:
+                # One record per key ID in a single file.
+                save_path = output_format.output_path(
+                    build_output_path(subfolder, last_run_input_path)
+                )
 
-        filename = (
-            os.path.basename(last_run_input_path)
-            if last_run_input_path
-            else datetime.now().strftime("%Y-%m-%dT%H-%M-%S") + ".json"
-        )
+                with atomic_output(save_path, output_format) as stream:
+                    for multi_key_id, payload in last_multi.payloads.items():
+                        write_document(
+                            stream,
+                            payload,
+                            output_format,
+                            last_run_input_path,
+                            multi_key_id,
+                        )
+
+                append_status(f"Output saved: {save_path}", QColor("#4caf50"))
+                return
+
+            if last_run_mode is Mode.ENCRYPT and last_multi:
+                for multi_key_id, payload in last_multi.payloads.items():
+                    save_path = save_document(
+                        build_output_path(
+                            os.path.join(subfolder, multi_key_id), last_run_input_path
+                        ),
+                        payload,
+                        output_format,
+                    )
 
-        save_path = os.path.join(folder, filename)
+                    append_status(f"Output saved: {save_path}", QColor("#4caf50"))
+                return
 
-        try:
-            with open(save_path, "w", encoding="utf-8") as f:
-                f.write(last_result)
+            base_path = build_output_path(subfolder, last_run_input_path)
+            save_path = save_document(
+                base_path, last_result, output_format, last_run_input_path, last_key_id
+            )
 
             append_status(f"Output saved: {save_path}", QColor("#4caf50"))
 
+            if last_run_mode is Mode.DECRYPT and last_nested:
+                map_path = nested_map_path(base_path)
+
+                with open(map_path, "w", encoding="utf-8") as f:
+                    json.dump(nested_map_to_json(last_nested), f, indent=4)
+
+                append_status(f"Nested payload map saved: {map_path}", QColor("#4caf50"))
+
         except Exception as e:
             append_status(f"Save failed: {e}", QColor("#ff5555"))
 
     # ----------------- Signals -----------------
+    refresh_keys_button.clicked.connect(load_access_keys)
     load_file_button.clicked.connect(on_load_file)
     clear_file_button.clicked.connect(on_clear_file)
 
@@ -452,12 +957,28 @@ def run_gui(access_keys):
     input_text_edit.textChanged.connect(update_ui)
 
     run_button.clicked.connect(on_run_clicked)
+    cancel_button.clicked.connect(on_cancel_clicked)
     copy_output_button.clicked.connect(on_copy_output)
     save_output_button.clicked.connect(on_save_output)
 
+    # The key store calls back on its own thread; hop to the GUI thread.
+    key_store_signals = WorkerSignals()
+    key_store_signals.finished.connect(on_key_ring_changed)
+    key_store.subscribe(
+        lambda key_ring: key_store_signals.emit_safely("finished", key_ring)
+    )
+    app.aboutToQuit.connect(key_store.stop)
+    app.aboutToQuit.connect(release_loaded_file)
+
     # ----------------- Initial UI State  -----------------
     populate_key_ids()
     update_ui()
 
+    if on_first_paint is not None:
+        first_paint_filter = FirstPaintFilter(on_first_paint)
+        window.installEventFilter(first_paint_filter)
+
     window.show()
+    load_access_keys()
+    key_store.start()
     sys.exit(app.exec())
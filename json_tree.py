@@ -0,0 +1,145 @@
+from PyQt6.QtCore import QAbstractItemModel, QModelIndex, Qt
+
+FETCH_BATCH_SIZE = 500
+MAX_DISPLAY_LENGTH = 1000
+
+HEADERS = ("Key", "Value")
+
+
+def describe_value(value):
+    if isinstance(value, dict):
+        return f"{{{len(value)}}}"
+    if isinstance(value, list):
+        return f"[{len(value)}]"
+    if isinstance(value, str):
+        text = value
+    elif value is None:
+        text = "null"
+    elif isinstance(value, bool):
+        text = "true" if value else "false"
+    else:
+        text = str(value)
+
+    if len(text) > MAX_DISPLAY_LENGTH:
+        return text[:MAX_DISPLAY_LENGTH] + "…"
+    return text
+
+
+class JsonNode:
+    __slots__ = ("key", "value", "parent", "row", "children", "_items")
+
+    def __init__(self, key, value, parent, row):
+        self.key = key
+        self.value = value
+        self.parent = parent
+        self.row = row
+        self.children = []
+        self._items = None
+
+    @property
+    def child_count(self):
+        if isinstance(self.value, (dict, list)):
+            return len(self.value)
+        return 0
+
+    def can_fetch_more(self):
+        return len(self.children) < self.child_count
+
+    def fetch_more(self, count):
+        """
+        Create up to `count` more child nodes and return how many were added.
+        """
+        if self._items is None:
+            self._items = (
+                iter(self.value.items())
+                if isinstance(self.value, dict)
+                else enumerate(self.value)
+            )
+
+        start = len(self.children)
+
+        for _ in range(count):
+            try:
+                key, value = next(self._items)
+            except StopIteration:
+                break
+            self.children.append(JsonNode(str(key), value, self, len(self.children)))
+
+        return len(self.children) - start
+
+
+class JsonTreeModel(QAbstractItemModel):
+    """
+    Read-only tree model over a parsed JSON document.
+
+    Child rows are created in batches only when a node is expanded or
+    scrolled into view, so opening a large profile does not copy or
+    format the whole document.
+    """
+
+    def __init__(self, document, parent=None):
+        super().__init__(parent)
+        self.root = JsonNode("", document, None, 0)
+
+    def _node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index(self, row, column, parent=QModelIndex()):
+        parent_node = self._node(parent)
+
+        if row < 0 or row >= len(parent_node.children):
+            return QModelIndex()
+
+        return self.createIndex(row, column, parent_node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+
+        parent_node = index.internalPointer().parent
+        if parent_node is None or parent_node is self.root:
+            return QModelIndex()
+
+        return self.createIndex(parent_node.row, 0, parent_node)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self._node(parent).children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(HEADERS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        return self._node(parent).child_count > 0
+
+    def canFetchMore(self, parent):
+        return self._node(parent).can_fetch_more()
+
+    def fetchMore(self, parent):
+        node = self._node(parent)
+        remaining = node.child_count - len(node.children)
+        count = min(FETCH_BATCH_SIZE, remaining)
+
+        if count <= 0:
+            return
+
+        start = len(node.children)
+        self.beginInsertRows(parent, start, start + count - 1)
+        node.fetch_more(count)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+
+        node = index.internalPointer()
+        return node.key if index.column() == 0 else describe_value(node.value)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if (
+            orientation == Qt.Orientation.Horizontal
+            and role == Qt.ItemDataRole.DisplayRole
+        ):
+            return HEADERS[section]
+        return None
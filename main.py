@@ -1,10 +1,9 @@
 from gui import run_gui
-from utils import fetch_access_keys
+from utils import load_cached_access_keys
 
 
 def main():
-    access_keys = fetch_access_keys()
-    run_gui(access_keys)
+    run_gui(load_cached_access_keys())
 
 
 if __name__ == "__main__":
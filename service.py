@@ -0,0 +1,569 @@
+import argparse
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from cli import add_result_cache_arguments, result_cache_options
+from config import (
+    AUTO_KEY_ID,
+    KEY_REFRESH_INTERVAL,
+    SERVICE_HOST,
+    SERVICE_MAX_BODY_SIZE,
+    SERVICE_MAX_CONCURRENCY,
+    SERVICE_PORT,
+)
+from core.decrypter import DBDDecrypter
+from core.document import JsonDocument
+from core.encrypter import DBDEncrypter
+from core.result_cache import ResultCache
+from utils import (
+    KeyStore,
+    UnknownKeyIdError,
+    as_key_ring,
+    extract_dbd_payload,
+    fetch_access_keys,
+    is_dbd_payload,
+)
+
+LATENCY_WINDOW = 10000
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ==================
+# Workers
+# ==================
+
+_decrypter = None
+_encrypter = None
+
+
+def _init_worker(access_keys):
+    global _decrypter, _encrypter
+
+    _decrypter = DBDDecrypter(access_keys)
+    _encrypter = DBDEncrypter(access_keys)
+
+
+def _worker_context():
+    # The pool starts workers on demand, while client connections are open.
+    # Forked workers would inherit those sockets and keep them open after
+    # the service closes them, so "Connection: close" clients never see the
+    # end of the response. Forkserver and spawn workers start clean.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _decrypt_body(body, key_id):
+    data = extract_dbd_payload(body)
+
+    if not is_dbd_payload(data):
+        raise ValueError("Input is already decrypted or is in an invalid format.")
+
+    decrypt_result = _decrypter.decrypt_result(data, key_id)
+    return decrypt_result.text, decrypt_result.key_id
+
+
+def _encrypt_body(body, key_id):
+    data = str(body, "utf-8")
+
+    if is_dbd_payload(data):
+        raise ValueError("Input is already encrypted or is in an invalid format.")
+
+    document = JsonDocument(data)
+
+    if document.is_blank or not document.is_valid():
+        raise ValueError("Encryption input must be valid JSON.")
+
+    return _encrypter.encrypt(document, key_id), key_id
+
+
+# ==================
+# Metrics
+# ==================
+
+
+class LatencyTracker:
+    """
+    Request count, error count and latency percentiles for one endpoint.
+
+    Percentiles cover the most recent `window` requests.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+
+    def record(self, seconds, failed=False):
+        self.samples.append(seconds)
+        self.count += 1
+        if failed:
+            self.errors += 1
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return None
+
+        ordered = sorted(self.samples)
+        rank = max(math.ceil(fraction * len(ordered)), 1)
+        return ordered[rank - 1]
+
+    def snapshot(self):
+        p50 = self.percentile(0.50)
+        p99 = self.percentile(0.99)
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "p50_ms": None if p50 is None else round(p50 * 1000, 3),
+            "p99_ms": None if p99 is None else round(p99 * 1000, 3),
+        }
+
+
+# ==================
+# Service
+# ==================
+
+
+class CryptoService:
+    """
+    Local HTTP service that decrypts and encrypts payloads in a process pool.
+
+    Endpoints:
+        POST /decrypt?key_id=auto        body: payload, optionally with
+                                         surrounding capture text
+        POST /encrypt?key_id=<key ID>    body: JSON (defaults to the latest
+                                         live key)
+        GET  /metrics                    request counts, p50/p99 latency and
+                                         result cache stats
+        GET  /health                     liveness and number of loaded keys
+
+    At most `max_concurrency` requests are processed at once; the rest wait
+    on their connection until a slot frees up. Access keys are loaded once
+    and handed to each worker process when the pool starts.
+
+    With a `result_cache`, decrypt bodies seen before are answered from it
+    without entering the pool; responses carry X-Cache: hit or miss.
+
+    With a `key_store`, new keys replace the worker pool: requests already
+    running finish on the old pool with the old keys, and new requests go
+    to a pool started with the new ones. A request that names an unknown
+    key ID triggers one on-demand refresh and is retried if it helped.
+    """
+
+    def __init__(
+        self,
+        access_keys,
+        workers=None,
+        max_concurrency=SERVICE_MAX_CONCURRENCY,
+        max_body_size=SERVICE_MAX_BODY_SIZE,
+        result_cache=None,
+        key_store=None,
+    ):
+        self.access_keys = as_key_ring(access_keys)
+        self.max_body_size = max_body_size
+        self.result_cache = result_cache
+        self.key_store = key_store
+        self.workers = workers or os.cpu_count()
+        self.executor = self._start_executor(self.access_keys)
+        self.concurrency = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.latency = {"decrypt": LatencyTracker(), "encrypt": LatencyTracker()}
+        self.server = None
+
+    async def start(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        """
+        Start listening and return the bound port (useful with port 0).
+        """
+        if self.key_store is not None:
+            loop = asyncio.get_running_loop()
+            self.key_store.subscribe(
+                lambda key_ring: loop.call_soon_threadsafe(self.apply_key_ring, key_ring)
+            )
+
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+        self.executor.shutdown(cancel_futures=True)
+
+    def apply_key_ring(self, key_ring):
+        """
+        Route new requests to a worker pool holding `key_ring`.
+        """
+        if key_ring is self.access_keys:
+            return
+
+        previous_executor = self.executor
+        self.access_keys = key_ring
+        self.executor = self._start_executor(key_ring)
+        previous_executor.shutdown(wait=False)
+
+        if self.result_cache is not None:
+            self.result_cache.invalidate()
+
+    def _start_executor(self, key_ring):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=_worker_context(),
+            initializer=_init_worker,
+            initargs=(key_ring,),
+        )
+
+    def metrics(self):
+        metrics = {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "endpoints": {
+                name: tracker.snapshot() for name, tracker in self.latency.items()
+            },
+        }
+
+        if self.result_cache is not None:
+            metrics["result_cache"] = self.result_cache.stats()
+
+        if self.key_store is not None:
+            metrics["access_keys"] = self.key_store.stats()
+
+        return metrics
+
+    # ----------------- Connection Handling -----------------
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as exc:
+                    await self._write_response(
+                        writer, exc.status, {"error": str(exc)}, keep_alive=False
+                    )
+                    break
+
+                if request is None:
+                    break
+
+                method, target, headers, body = request
+                status, response_body, extra_headers = await self._dispatch(
+                    method, target, body
+                )
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._write_response(
+                    writer, status, response_body, extra_headers, keep_alive
+                )
+
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as exc:
+            if exc.partial:
+                raise HttpError(400, "Incomplete request.") from None
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "Request headers are too large.") from None
+
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line.") from None
+
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if "transfer-encoding" in headers:
+            raise HttpError(501, "Chunked request bodies are not supported.")
+
+        content_length = headers.get("content-length")
+
+        if content_length is None:
+            if method == "POST":
+                raise HttpError(411, "Content-Length is required.")
+            return method, target, headers, b""
+
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length.") from None
+
+        if content_length > self.max_body_size:
+            raise HttpError(413, f"Body exceeds {self.max_body_size} bytes.")
+
+        body = await reader.readexactly(content_length)
+        return method, target, headers, body
+
+    async def _write_response(
+        self, writer, status, body, extra_headers=None, keep_alive=True
+    ):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+            content_type = "application/json"
+        else:
+            content_type = "text/plain; charset=utf-8"
+
+        payload = body.encode("utf-8")
+
+        header_lines = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(payload)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        header_lines.extend(
+            f"{name}: {value}" for name, value in (extra_headers or {}).items()
+        )
+
+        writer.write(("\r\n".join(header_lines) + "\r\n\r\n").encode("latin-1"))
+        writer.write(payload)
+        await writer.drain()
+
+    # ----------------- Routing -----------------
+
+    async def _dispatch(self, method, target, body):
+        """
+        Return (status, body, extra_headers) for one request.
+        """
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        if url.path == "/health":
+            if method != "GET":
+                return 405, {"error": "Use GET."}, None
+            return 200, {"status": "ok", "access_keys": len(self.access_keys)}, None
+
+        if url.path == "/metrics":
+            if method != "GET":
+                return 405, {"error": "Use GET."}, None
+            return 200, self.metrics(), None
+
+        if url.path in ("/decrypt", "/encrypt"):
+            if method != "POST":
+                return 405, {"error": "Use POST."}, None
+            return await self._run_crypto(url.path[1:], query, body)
+
+        return 404, {"error": f"Unknown path: {url.path}"}, None
+
+    async def _run_crypto(self, operation, query, body):
+        if operation == "decrypt":
+            function = _decrypt_body
+            key_id = query.get("key_id", AUTO_KEY_ID)
+        else:
+            function = _encrypt_body
+            key_id = query.get("key_id") or self.access_keys.latest()
+            if key_id is None:
+                return 400, {"error": "No live key ID available."}, None
+
+        tracker = self.latency[operation]
+        loop = asyncio.get_running_loop()
+
+        # Latency includes time spent waiting for a concurrency slot.
+        start = time.perf_counter()
+
+        use_cache = operation == "decrypt" and self.result_cache is not None
+
+        if use_cache:
+            # Hashing large bodies and the disk tier stay off the event loop.
+            digest = await asyncio.to_thread(self.result_cache.digest, body, key_id)
+            cached = await asyncio.to_thread(
+                self.result_cache.get, digest, self.access_keys
+            )
+
+            if cached is not None:
+                tracker.record(time.perf_counter() - start)
+                extra_headers = {"X-Key-Id": cached.key_id or "", "X-Cache": "hit"}
+                return 200, cached.text, extra_headers
+
+        async with self.concurrency:
+            self.in_flight += 1
+
+            try:
+                try:
+                    result, used_key_id = await loop.run_in_executor(
+                        self.executor, function, body, key_id
+                    )
+                except UnknownKeyIdError as exc:
+                    if not await self._refresh_for_unknown(exc.key_id):
+                        raise
+
+                    result, used_key_id = await loop.run_in_executor(
+                        self.executor, function, body, key_id
+                    )
+            except ValueError as exc:
+                tracker.record(time.perf_counter() - start, failed=True)
+                return 400, {"error": str(exc)}, None
+            except Exception as exc:
+                tracker.record(time.perf_counter() - start, failed=True)
+                return 500, {"error": f"{type(exc).__name__}: {exc}"}, None
+            finally:
+                self.in_flight -= 1
+
+        extra_headers = {"X-Key-Id": used_key_id or ""}
+
+        if use_cache:
+            await asyncio.to_thread(
+                self.result_cache.put,
+                digest,
+                result,
+                used_key_id,
+                self.access_keys,
+                len(body),
+            )
+            extra_headers["X-Cache"] = "miss"
+
+        tracker.record(time.perf_counter() - start)
+        return 200, result, extra_headers
+
+    async def _refresh_for_unknown(self, key_id):
+        if self.key_store is None:
+            return False
+
+        if not await asyncio.to_thread(self.key_store.refresh_for_unknown, key_id):
+            return False
+
+        # The listener may not have run yet; the retry needs the new pool.
+        self.apply_key_ring(self.key_store.key_ring)
+        return True
+
+
+# ==================
+# Entry Point
+# ==================
+
+
+async def run_service(
+    access_keys,
+    host,
+    port,
+    workers,
+    max_concurrency,
+    result_cache=None,
+    key_refresh_interval=KEY_REFRESH_INTERVAL,
+):
+    key_store = KeyStore(access_keys, interval=key_refresh_interval)
+    service = CryptoService(
+        access_keys,
+        workers,
+        max_concurrency,
+        result_cache=result_cache,
+        key_store=key_store,
+    )
+    bound_port = await service.start(host, port)
+
+    print(f"Serving on http://{host}:{bound_port} with {len(access_keys)} access keys")
+
+    if key_refresh_interval:
+        key_store.start()
+
+    try:
+        await service.serve_forever()
+    finally:
+        key_store.stop()
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve decrypt and encrypt endpoints over local HTTP."
+    )
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=SERVICE_MAX_CONCURRENCY,
+        help="requests processed at once; others wait",
+    )
+    parser.add_argument(
+        "--key-refresh-interval",
+        type=float,
+        default=KEY_REFRESH_INTERVAL,
+        help="seconds between background access key refreshes; 0 disables "
+        "them, but unknown key IDs still trigger a refresh",
+    )
+    add_result_cache_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    access_keys = fetch_access_keys()
+    if not access_keys:
+        print("No access keys available.", file=sys.stderr)
+        return 1
+
+    cache_options = result_cache_options(args)
+    result_cache = None if cache_options is None else ResultCache(**cache_options)
+
+    try:
+        asyncio.run(
+            run_service(
+                access_keys,
+                args.host,
+                args.port,
+                args.workers,
+                args.max_concurrency,
+                result_cache,
+                args.key_refresh_interval,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
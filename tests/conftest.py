@@ -0,0 +1,97 @@
+import base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import KeyRing  # noqa: E402
+
+TEST_KEY_IDS = ("9.5.0_live", "9.5.0_ptb", "9.5.1_live")
+
+
+def make_access_key(seed):
+    return base64.b64encode(bytes((seed + index) % 256 for index in range(32))).decode()
+
+
+@pytest.fixture
+def access_keys():
+    return KeyRing(
+        {key_id: make_access_key(index) for index, key_id in enumerate(TEST_KEY_IDS)}
+    )
+
+
+@pytest.fixture
+def work_dir(tmp_path, monkeypatch):
+    """
+    Run the test from an empty folder, since results go to ./Output.
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+class KeyServer:
+    """
+    Local stand-in for the key API, serving `keys` with an ETag that changes
+    whenever publish() is called.
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.version = 0
+        self.down = False
+        self.requests = []
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.headers.get("If-None-Match"))
+                etag = f'"v{server.version}"'
+
+                if server.down:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                body = "".join(
+                    f'"{key_id}": "{access_key}"\n'
+                    for key_id, access_key in server.keys.items()
+                ).encode()
+
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.http = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.http.server_address[1]}/keys"
+
+    def publish(self, keys):
+        self.keys = dict(keys)
+        self.version += 1
+
+
+@pytest.fixture
+def key_server(access_keys):
+    server = KeyServer()
+    server.publish(access_keys)
+    thread = threading.Thread(target=server.http.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.http.shutdown()
+    server.http.server_close()
@@ -0,0 +1,68 @@
+import socket
+
+import pytest
+import requests
+
+from conftest import make_access_key
+from utils import download_access_keys, fetch_access_keys, load_key_cache
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "access_keys.json")
+
+
+def test_fetch_saves_keys_and_etag_to_cache(key_server, access_keys, cache_path):
+    assert fetch_access_keys(key_server.url, cache_path) == access_keys
+
+    cache = load_key_cache(cache_path)
+    assert cache["access_keys"] == dict(access_keys)
+    assert cache["etag"] == '"v1"'
+
+
+def test_unchanged_keys_are_revalidated_from_cache(key_server, access_keys, cache_path):
+    fetch_access_keys(key_server.url, cache_path)
+    fetched_at = load_key_cache(cache_path)["fetched_at"]
+
+    assert fetch_access_keys(key_server.url, cache_path) == access_keys
+    assert key_server.requests == [None, '"v1"']
+    assert load_key_cache(cache_path)["fetched_at"] >= fetched_at
+
+
+def test_published_keys_replace_cached_ones(key_server, access_keys, cache_path):
+    fetch_access_keys(key_server.url, cache_path)
+
+    rotated = dict(access_keys, **{"9.6.0_live": make_access_key(40)})
+    key_server.publish(rotated)
+
+    access_keys = fetch_access_keys(key_server.url, cache_path)
+    assert dict(access_keys) == rotated
+    assert access_keys.latest() == "9.6.0_live"
+    assert load_key_cache(cache_path)["etag"] == '"v2"'
+
+
+def test_server_error_falls_back_to_cache(key_server, access_keys, cache_path):
+    fetch_access_keys(key_server.url, cache_path)
+    key_server.down = True
+
+    with pytest.raises(requests.HTTPError):
+        download_access_keys(key_server.url, cache_path)
+
+    assert fetch_access_keys(key_server.url, cache_path) == access_keys
+
+
+def test_offline_falls_back_to_cache(key_server, access_keys, cache_path):
+    fetch_access_keys(key_server.url, cache_path)
+
+    with socket.socket() as closed:
+        closed.bind(("127.0.0.1", 0))
+        offline_url = f"http://127.0.0.1:{closed.getsockname()[1]}/keys"
+
+    assert fetch_access_keys(offline_url, cache_path) == access_keys
+
+
+def test_offline_without_cache_returns_empty_ring(key_server, cache_path):
+    key_server.down = True
+
+    assert len(fetch_access_keys(key_server.url, cache_path)) == 0
+    assert load_key_cache(cache_path) is None
@@ -0,0 +1,83 @@
+from contextlib import contextmanager
+import json
+
+import pytest
+
+import capture
+from capture import NDJSON_FILENAME, decrypt_capture, iter_raw_payloads
+from core.encrypter import DBDEncrypter
+from utils import open_input_file
+
+PAYLOAD_COUNT = 12
+
+
+@pytest.fixture
+def raw_dump(tmp_path, access_keys):
+    # More than nine payloads in one entry, so "_10" sorts before "_2" as text.
+    encrypter = DBDEncrypter(access_keys)
+    payloads = [
+        encrypter.encrypt(json.dumps({"n": n}), "9.5.0_live")
+        for n in range(PAYLOAD_COUNT)
+    ]
+    dump_path = tmp_path / "dump.txt"
+    dump_path.write_text("\n".join(payloads))
+    return dump_path
+
+
+def read_index(output_folder):
+    return json.loads((output_folder / "index.json").read_text())
+
+
+def test_index_lists_payloads_in_capture_order(tmp_path, raw_dump, access_keys):
+    output_folder = tmp_path / "out"
+
+    assert decrypt_capture(
+        str(raw_dump), "auto", access_keys, str(output_folder), workers=2
+    ) == (PAYLOAD_COUNT, 0, None)
+
+    files = [record["file"] for record in read_index(output_folder)]
+    assert files == [f"00000_dump_{n}.json" for n in range(1, PAYLOAD_COUNT + 1)]
+
+    for n, file_name in enumerate(files):
+        assert json.loads((output_folder / file_name).read_text()) == {"n": n}
+
+
+def test_ndjson_lines_follow_capture_order(tmp_path, raw_dump, access_keys):
+    output_folder = tmp_path / "out"
+
+    decrypt_capture(
+        str(raw_dump),
+        "auto",
+        access_keys,
+        str(output_folder),
+        workers=2,
+        output_format="ndjson",
+    )
+
+    lines = (output_folder / NDJSON_FILENAME).read_text().splitlines()
+    assert [json.loads(line)["data"] for line in lines] == [
+        {"n": n} for n in range(PAYLOAD_COUNT)
+    ]
+
+    index = read_index(output_folder)
+    assert [record["line"] for record in index] == list(range(1, PAYLOAD_COUNT + 1))
+
+
+@pytest.mark.parametrize("consumed", [PAYLOAD_COUNT, 1])
+def test_raw_dump_memory_map_is_closed(raw_dump, monkeypatch, consumed):
+    maps = []
+
+    @contextmanager
+    def open_mapped(file_path):
+        with open_input_file(file_path, mmap_threshold=0) as data:
+            maps.append(data)
+            yield data
+
+    monkeypatch.setattr(capture, "open_input_file", open_mapped)
+
+    payloads = iter_raw_payloads(str(raw_dump))
+    for _ in range(consumed):
+        next(payloads)
+    payloads.close()
+
+    assert maps[0].closed
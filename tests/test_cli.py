@@ -0,0 +1,87 @@
+import functools
+import json
+
+import pytest
+
+import cli
+from core.encrypter import DBDEncrypter
+
+
+def write_payload(path, access_keys, value):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(DBDEncrypter(access_keys).encrypt(json.dumps(value), "9.5.0_live"))
+
+
+def test_same_named_inputs_in_different_folders_keep_separate_outputs(
+    work_dir, access_keys
+):
+    write_payload(work_dir / "in" / "a" / "x.json", access_keys, {"folder": "a"})
+    write_payload(work_dir / "in" / "b" / "x.json", access_keys, {"folder": "b"})
+
+    file_paths = cli.expand_inputs(["in"])
+    failures = cli.run_batch("decrypt", file_paths, "auto", access_keys, workers=1)
+
+    assert failures == 0
+    output = work_dir / "Output" / "Decrypted"
+    assert json.loads((output / "a" / "x.json").read_text()) == {"folder": "a"}
+    assert json.loads((output / "b" / "x.json").read_text()) == {"folder": "b"}
+
+
+def test_inputs_in_one_folder_are_saved_by_name(work_dir, access_keys):
+    write_payload(work_dir / "in" / "x.json", access_keys, {"name": "x"})
+
+    failures = cli.run_batch(
+        "decrypt", cli.expand_inputs(["in/*.json"]), "auto", access_keys, workers=1
+    )
+
+    assert failures == 0
+    output_path = work_dir / "Output" / "Decrypted" / "x.json"
+    assert json.loads(output_path.read_text()) == {"name": "x"}
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [
+        ["encrypt", "--key-id", ""],
+        ["encrypt", "--key-id", ","],
+        ["encrypt", "--key-id", "auto,9.5.0_live"],
+        ["decrypt", "--key-id", "9.5.0_live,9.5.0_ptb"],
+        ["decrypt", "--all-branches"],
+        ["decrypt", "--deep", "--max-depth", "0"],
+    ],
+)
+def test_invalid_arguments_are_usage_errors(work_dir, arguments):
+    (work_dir / "x.json").write_text("{}")
+
+    with pytest.raises(SystemExit) as exc_info:
+        cli.main([*arguments, "x.json"])
+
+    assert exc_info.value.code == 2
+
+
+def test_every_listed_key_id_must_exist(work_dir, access_keys, monkeypatch, capsys):
+    monkeypatch.setattr(cli, "fetch_access_keys", lambda: access_keys)
+    (work_dir / "x.json").write_text("{}")
+
+    assert cli.main(["encrypt", "x.json", "--key-id", "9.5.0_live,9.9.0_live"]) == 1
+    assert '"9.9.0_live" was not found' in capsys.readouterr().err
+    assert not (work_dir / "Output").exists()
+
+
+@pytest.mark.parametrize("prefix", ["DbdDAgAC", "DbdDAwAC"])
+def test_decrypt_errors_from_memory_mapped_inputs_are_reported(
+    work_dir, access_keys, monkeypatch, prefix
+):
+    # Memory-map every input, as for files of MMAP_THRESHOLD bytes or more.
+    monkeypatch.setattr(
+        cli,
+        "open_input_file",
+        functools.partial(cli.open_input_file, mmap_threshold=0),
+    )
+    cli._init_worker(access_keys)
+
+    input_path = work_dir / "corrupt.txt"
+    input_path.write_text(prefix + "QUJDRA" * 64)
+
+    with pytest.raises(ValueError):
+        cli._decrypt_file(str(input_path), "auto")
@@ -0,0 +1,61 @@
+import base64
+import dataclasses
+import json
+import zlib
+
+import pytest
+
+from config import DataPrefixes
+from core.compression import COMPRESSION_PROFILES
+from core.decrypter import DBDDecrypter
+from core.encrypter import DBDEncrypter
+from utils import PAYLOAD_PREFIX_LENGTH
+
+PLAINTEXT = json.dumps(
+    {
+        "name": "Entity 🐙 ñ",
+        "items": [
+            {"id": index, "tags": ["a", "b"] * (index % 5)} for index in range(2000)
+        ],
+    }
+)
+
+
+PROFILES = [
+    pytest.param(profile, id=name) for name, profile in COMPRESSION_PROFILES.items()
+]
+# Chunks small enough to land between the halves of a surrogate pair if
+# slicing were done on the encoded bytes.
+PROFILES += [
+    pytest.param(dataclasses.replace(profile, chunk_size=7), id=f"{name}-small-chunks")
+    for name, profile in COMPRESSION_PROFILES.items()
+    if profile.streaming
+]
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_zlib_payload_has_game_framing(access_keys, profile):
+    payload = DBDEncrypter(access_keys, compression=profile).compress(PLAINTEXT)
+
+    assert payload.startswith(DataPrefixes.ZLIB)
+
+    raw = base64.b64decode(payload[PAYLOAD_PREFIX_LENGTH:])
+    utf16_bytes = zlib.decompress(raw[4:])
+
+    assert int.from_bytes(raw[:4], "little") == len(utf16_bytes)
+    assert utf16_bytes.decode("utf-16-le") == PLAINTEXT
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_payloads_round_trip(access_keys, profile):
+    encrypter = DBDEncrypter(access_keys, compression=profile)
+    decrypter = DBDDecrypter(access_keys)
+
+    assert decrypter.decrypt(encrypter.compress(PLAINTEXT), "auto") == PLAINTEXT
+    assert decrypter.decrypt(encrypter.encrypt_profile(PLAINTEXT), "auto") == PLAINTEXT
+
+    payload = encrypter.encrypt(PLAINTEXT, "9.5.0_live")
+    decrypt_result = decrypter.decrypt_result(payload, "auto")
+
+    assert decrypt_result.text == PLAINTEXT
+    assert decrypt_result.key_id == "9.5.0_live"
@@ -0,0 +1,47 @@
+import json
+import threading
+
+import pytest
+
+from core.decrypter import DBDDecrypter
+from core.encrypter import DBDEncrypter
+from core.instrumentation import StageRecorder
+
+PLAINTEXT = json.dumps({"profile": [{"id": index} for index in range(500)]})
+KEY_IDS = ["9.5.0_live", "9.5.0_ptb", "9.5.1_live"]
+
+
+def test_progress_and_stage_timings_stay_on_calling_thread(access_keys):
+    progress_threads = []
+    stage_recorder = StageRecorder()
+    encrypter = DBDEncrypter(
+        access_keys,
+        progress=lambda stage: progress_threads.append(threading.get_ident()),
+        instrumentation=stage_recorder,
+    )
+
+    multi = encrypter.encrypt_many(PLAINTEXT, KEY_IDS)
+
+    assert set(progress_threads) == {threading.get_ident()}
+    summary = stage_recorder.summary()
+    assert summary[(1, "aes")]["calls"] == len(KEY_IDS)
+    # One more base64 stage encodes the shared zlib layer.
+    assert summary[(1, "base64")]["calls"] == len(KEY_IDS) + 1
+    assert list(multi.key_seconds) == KEY_IDS
+
+    decrypter = DBDDecrypter(access_keys)
+    for key_id, payload in multi.payloads.items():
+        decrypt_result = decrypter.decrypt_result(payload, "auto")
+        assert (decrypt_result.text, decrypt_result.key_id) == (PLAINTEXT, key_id)
+
+
+def test_progress_callback_can_cancel(access_keys):
+    class Cancelled(Exception):
+        pass
+
+    def progress(stage):
+        if stage == "aes":
+            raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        DBDEncrypter(access_keys, progress=progress).encrypt_many(PLAINTEXT, KEY_IDS)
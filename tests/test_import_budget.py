@@ -0,0 +1,29 @@
+from benchmark import (
+    CORE_FORBIDDEN_IMPORTS,
+    CORE_IMPORT_BUDGET_MS,
+    CORE_MODULES,
+    measure_import_times,
+)
+
+# Fresh interpreters measured; the fastest run is compared with the budget
+# so a busy machine does not fail the test.
+IMPORT_TIME_RUNS = 3
+
+
+def test_core_import_time_is_within_budget():
+    totals_ms = [
+        sum(import_times[module] for module in CORE_MODULES) / 1000
+        for import_times in (
+            measure_import_times(CORE_MODULES) for _ in range(IMPORT_TIME_RUNS)
+        )
+    ]
+
+    assert min(totals_ms) <= CORE_IMPORT_BUDGET_MS
+
+
+def test_core_does_not_import_heavy_dependencies():
+    imported = measure_import_times(CORE_MODULES)
+
+    assert [
+        name for name in imported if name.split(".", 1)[0] in CORE_FORBIDDEN_IMPORTS
+    ] == []
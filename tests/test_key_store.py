@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from conftest import make_access_key
+from utils import KeyStore, download_access_keys
+
+NEW_KEY_ID = "9.6.0_live"
+
+
+@pytest.fixture
+def key_store(key_server, access_keys, tmp_path):
+    cache_path = str(tmp_path / "access_keys.json")
+    return KeyStore(
+        access_keys,
+        fetch=lambda: download_access_keys(key_server.url, cache_path),
+        interval=0.05,
+        retry=0.01,
+        jitter=0,
+        on_demand_interval=60,
+    )
+
+
+def rotate(key_server, access_keys):
+    rotated = dict(access_keys, **{NEW_KEY_ID: make_access_key(40)})
+    key_server.publish(rotated)
+    return rotated
+
+
+def test_refresh_replaces_keys_and_notifies(key_server, access_keys, key_store):
+    changes = []
+    key_store.subscribe(changes.append)
+
+    assert not key_store.refresh()
+    assert not key_store.refresh()
+    assert changes == []
+
+    rotated = rotate(key_server, access_keys)
+
+    assert key_store.refresh()
+    assert dict(key_store.key_ring) == rotated
+    assert changes == [key_store.key_ring]
+    assert key_store.stats()["changes"] == 1
+
+
+def test_empty_or_failed_fetch_keeps_current_keys(key_server, access_keys, key_store):
+    key_server.publish({})
+    assert not key_store.refresh()
+    assert key_store.key_ring == access_keys
+
+    key_server.down = True
+    with pytest.raises(requests.HTTPError):
+        key_store.refresh()
+    assert key_store.key_ring == access_keys
+
+
+def test_refresh_for_unknown_key_id(key_server, access_keys, key_store):
+    assert key_store.refresh_for_unknown("9.5.0_live")
+    assert key_server.requests == []
+
+    rotate(key_server, access_keys)
+
+    assert key_store.refresh_for_unknown(NEW_KEY_ID)
+    assert NEW_KEY_ID in key_store.key_ring
+
+    # Further misses within on_demand_interval do not reach the server.
+    requests_made = len(key_server.requests)
+    assert not key_store.refresh_for_unknown("9.7.0_live")
+    assert len(key_server.requests) == requests_made
+
+
+def test_background_refresh_recovers_after_failures(key_server, access_keys, key_store):
+    changed = threading.Event()
+    key_store.subscribe(lambda key_ring: changed.set())
+    key_server.down = True
+
+    key_store.start()
+    try:
+        deadline = time.monotonic() + 5
+        while key_store.stats()["failures"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        rotate(key_server, access_keys)
+        key_server.down = False
+
+        assert changed.wait(5)
+    finally:
+        key_store.stop()
+
+    assert NEW_KEY_ID in key_store.key_ring
+    assert "500" in key_store.stats()["last_error"]
+
+
+def test_retry_delay_backs_off_up_to_interval(access_keys):
+    key_store = KeyStore(access_keys, interval=60, retry=5, jitter=0)
+
+    delays = [key_store._next_delay(failures) for failures in range(6)]
+    assert delays == [60, 5, 10, 20, 40, 60]
@@ -0,0 +1,30 @@
+import base64
+import json
+
+from config import DataPrefixes
+from core.decrypter import DBDDecrypter
+from core.encrypter import DBDEncrypter
+
+# A size header followed by bytes that are not a zlib stream.
+CORRUPT_ZLIB_PAYLOAD = DataPrefixes.ZLIB + base64.b64encode(
+    (16).to_bytes(4, "little") + b"not a zlib stream"
+).decode("ascii")
+
+
+def test_corrupt_nested_payload_is_left_as_string(access_keys):
+    encrypter = DBDEncrypter(access_keys)
+    document = {
+        "good": encrypter.compress(json.dumps({"inner": 1})),
+        "corrupt": CORRUPT_ZLIB_PAYLOAD,
+    }
+    payload = encrypter.encrypt(json.dumps(document), "9.5.0_live")
+
+    decrypt_result = DBDDecrypter(access_keys).decrypt_deep(payload, "auto")
+
+    assert decrypt_result.document.value == {
+        "good": {"inner": 1},
+        "corrupt": CORRUPT_ZLIB_PAYLOAD,
+    }
+    assert list(decrypt_result.nested) == ["/good"]
+    assert list(decrypt_result.errors) == ["/corrupt"]
+    assert "Invalid zlib payload" in decrypt_result.errors["/corrupt"]
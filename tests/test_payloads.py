@@ -0,0 +1,48 @@
+import json
+import textwrap
+
+import pytest
+
+from core.decrypter import DBDDecrypter
+from core.encrypter import DBDEncrypter
+from utils import extract_dbd_payload, iter_payload_spans, unwrap_payload
+
+PLAINTEXT = json.dumps({"items": [{"id": index} for index in range(300)]})
+
+
+@pytest.fixture
+def payload(access_keys):
+    payload = DBDEncrypter(access_keys).encrypt(PLAINTEXT, "9.5.0_live")
+    assert "/" in payload
+    return payload
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_json_escaped_payload_is_found_whole(access_keys, payload, binary):
+    data = json.dumps({"data": payload}).replace("/", "\\/") + "\n"
+    if binary:
+        data = data.encode("ascii")
+
+    extracted = extract_dbd_payload(data)
+    assert len(extracted) == len(payload) + payload.count("/")
+    assert DBDDecrypter(access_keys).decrypt(extracted, "auto") == PLAINTEXT
+
+
+def test_wrapped_payload_is_joined(access_keys, payload):
+    wrapped = "\r\n".join(textwrap.wrap(payload, 76))
+    text = f"Body:\n{wrapped}\nTRAILER"
+
+    # Without unwrapping, the scan stops at the first line break.
+    assert next(iter_payload_spans(text))[1] < len(payload)
+
+    unwrapped = unwrap_payload(text)
+    assert unwrapped.startswith("Body:\n" + payload)
+    assert unwrapped.endswith("\nTRAILER")
+    decrypter = DBDDecrypter(access_keys)
+    assert decrypter.decrypt(extract_dbd_payload(unwrapped), "auto") == PLAINTEXT
+
+
+def test_unwrapped_payload_is_left_alone(payload):
+    text = f"{payload}\nTRAILER\n"
+    assert unwrap_payload(text) == text
+    assert unwrap_payload("no payload here") == "no payload here"
@@ -0,0 +1,159 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import make_access_key
+from core.encrypter import DBDEncrypter
+from service import CryptoService
+from utils import KeyStore, download_access_keys
+
+DOCUMENT = {"profile": {"level": 50, "perks": ["a", "b"]}}
+
+# A response must reach EOF well before this, even when the request starts
+# the worker pool.
+RESPONSE_TIMEOUT = 5
+
+
+async def send_request(port, method, target, body=b""):
+    """
+    Send one request with "Connection: close" and return (status, headers,
+    body) once the service closes the connection.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"{method} {target} HTTP/1.1\r\n"
+        f"Host: localhost\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n".encode("latin-1")
+        + body
+    )
+    await writer.drain()
+
+    try:
+        response = await asyncio.wait_for(reader.read(), RESPONSE_TIMEOUT)
+    finally:
+        writer.close()
+
+    head, response_body = response.split(b"\r\n\r\n", 1)
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in header_lines)
+
+    return int(status_line.split(" ")[1]), headers, response_body.decode("utf-8")
+
+
+def run_with_service(access_keys, scenario, workers=1, **options):
+    async def main():
+        service = CryptoService(access_keys, workers=workers, **options)
+        port = await service.start("127.0.0.1", 0)
+
+        try:
+            return await scenario(service, port)
+        finally:
+            await service.close()
+
+    return asyncio.run(main())
+
+
+def test_decrypt_endpoint(access_keys):
+    payload = DBDEncrypter(access_keys).encrypt(json.dumps(DOCUMENT), "9.5.0_ptb")
+    capture = f"HTTP/1.1 200 OK\r\n\r\n{payload}\r\n".encode()
+
+    async def scenario(service, port):
+        return [
+            await send_request(port, "POST", "/decrypt", capture),
+            await send_request(port, "POST", "/decrypt?key_id=9.5.0_live", b"{}"),
+        ]
+
+    decrypted, rejected = run_with_service(access_keys, scenario)
+
+    status, headers, body = decrypted
+    assert status == 200
+    assert headers["X-Key-Id"] == "9.5.0_ptb"
+    assert json.loads(body) == DOCUMENT
+
+    status, _, body = rejected
+    assert status == 400
+    assert "already decrypted" in json.loads(body)["error"]
+
+
+def test_encrypt_endpoint(access_keys):
+    async def scenario(service, port):
+        return [
+            await send_request(port, "POST", "/encrypt", json.dumps(DOCUMENT).encode()),
+            await send_request(port, "POST", "/encrypt?key_id=9.5.0_ptb", b"{"),
+            await send_request(port, "GET", "/encrypt"),
+        ]
+
+    encrypted, invalid, wrong_method = run_with_service(access_keys, scenario)
+
+    status, headers, body = encrypted
+    assert status == 200
+    # The latest live key is used when no key ID is given.
+    assert headers["X-Key-Id"] == "9.5.1_live"
+    assert body.startswith("DbdDAwAC")
+
+    status, _, body = invalid
+    assert status == 400
+    assert json.loads(body)["error"] == "Encryption input must be valid JSON."
+
+    assert wrong_method[0] == 405
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_connection_close_is_not_held_open_by_workers(access_keys, workers):
+    # Workers start while the first connections are open; none of them may
+    # keep a client socket alive.
+    async def scenario(service, port):
+        requests = [
+            send_request(port, "POST", "/encrypt", json.dumps(DOCUMENT).encode())
+            for _ in range(workers * 2)
+        ]
+        return await asyncio.gather(*requests)
+
+    responses = run_with_service(access_keys, scenario, workers)
+    assert [status for status, _, _ in responses] == [200] * workers * 2
+
+
+def test_key_rotation_during_session(key_server, access_keys, tmp_path):
+    cache_path = str(tmp_path / "access_keys.json")
+    key_store = KeyStore(
+        access_keys,
+        fetch=lambda: download_access_keys(key_server.url, cache_path),
+        on_demand_interval=0,
+    )
+    body = json.dumps(DOCUMENT).encode()
+
+    async def scenario(service, port):
+        responses = [
+            await send_request(port, "POST", "/encrypt?key_id=9.6.0_live", body)
+        ]
+
+        # A key ID the service has not seen yet triggers a refresh.
+        key_server.publish(dict(access_keys, **{"9.6.0_live": make_access_key(40)}))
+        responses.append(
+            await send_request(port, "POST", "/encrypt?key_id=9.6.0_live", body)
+        )
+        payload = responses[-1][2].encode()
+        responses.append(await send_request(port, "POST", "/decrypt", payload))
+
+        # A background refresh reaches the service through its listener.
+        key_server.publish(
+            dict(key_store.key_ring, **{"9.7.0_live": make_access_key(50)})
+        )
+        assert await asyncio.to_thread(key_store.refresh)
+        responses.append(await send_request(port, "GET", "/health"))
+        responses.append(await send_request(port, "POST", "/encrypt", body))
+        return responses
+
+    unknown, refreshed, decrypted, health, latest = run_with_service(
+        access_keys, scenario, key_store=key_store
+    )
+
+    assert unknown[0] == 400
+    assert refreshed[0] == 200
+    assert refreshed[1]["X-Key-Id"] == "9.6.0_live"
+    assert decrypted[1]["X-Key-Id"] == "9.6.0_live"
+    assert json.loads(decrypted[2]) == DOCUMENT
+    assert json.loads(health[2])["access_keys"] == len(access_keys) + 2
+    assert latest[1]["X-Key-Id"] == "9.7.0_live"
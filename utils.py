@@ -1,10 +1,32 @@
 import base64
-import requests
+import binascii
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import mmap
+import os
+import random
+import re
+import tempfile
+import threading
+import time
 
 from config import (
+    DataPrefixes,
     EXCLUDED_PREFIXES,
     KEY_API_URL,
+    KEY_CACHE_PATH,
+    KEY_ON_DEMAND_REFRESH_INTERVAL,
+    KEY_REFRESH_INTERVAL,
+    KEY_REFRESH_JITTER,
+    KEY_REFRESH_RETRY,
     MIN_VERSION,
+    MMAP_SCAN_WINDOW,
+    MMAP_THRESHOLD,
+    NESTED_MAP_SUFFIX,
+    OUTPUT_FOLDER,
     REQUEST_TIMEOUT,
 )
 
@@ -22,6 +44,276 @@ def clean_quotes(value):
     return value.replace('\\"', '"')
 
 
+# ==================
+# Payload Helpers
+# ==================
+
+PAYLOAD_PREFIXES = (
+    DataPrefixes.CLIENT_DATA,
+    DataPrefixes.FULL_PROFILE,
+    DataPrefixes.ZLIB,
+)
+PAYLOAD_PREFIX_BYTES = tuple(prefix.encode("ascii") for prefix in PAYLOAD_PREFIXES)
+PAYLOAD_PREFIX_LENGTH = len(DataPrefixes.CLIENT_DATA)
+
+PAYLOAD_KINDS = {
+    DataPrefixes.CLIENT_DATA: "client-data",
+    DataPrefixes.FULL_PROFILE: "full-profile",
+    DataPrefixes.ZLIB: "zlib",
+}
+
+# A payload is a prefix followed by its run of base64 characters. Slashes
+# may be JSON-escaped as "\/"; base64 decoding skips the backslashes.
+PAYLOAD_PREFIX_PATTERN = "|".join(re.escape(prefix) for prefix in PAYLOAD_PREFIXES)
+PAYLOAD_PATTERN = (
+    rf"(?:{PAYLOAD_PREFIX_PATTERN})[A-Za-z0-9+/]*(?:\\/[A-Za-z0-9+/]*)*={{0,2}}"
+)
+# One line of a payload wrapped over several lines.
+WRAPPED_PAYLOAD_LINE_RE = re.compile(r"\r?\n([A-Za-z0-9+/\\]+={0,2})")
+
+PAYLOAD_TEXT_RE = re.compile(PAYLOAD_PATTERN)
+PAYLOAD_BYTES_RE = re.compile(PAYLOAD_PATTERN.encode("ascii"))
+PAYLOAD_PREFIX_BYTES_RE = re.compile(PAYLOAD_PREFIX_PATTERN.encode("ascii"))
+
+
+def is_dbd_payload(data):
+    if isinstance(data, str):
+        return data.startswith(PAYLOAD_PREFIXES)
+
+    prefix = bytes(memoryview(data)[:PAYLOAD_PREFIX_LENGTH])
+    return prefix.startswith(PAYLOAD_PREFIX_BYTES)
+
+
+def iter_payload_spans(data):
+    """
+    Yield (offset, length, kind) for every payload in str, bytes or mmap data.
+
+    The input is scanned once with a single pattern for all prefixes, and
+    spans are produced lazily. Memory maps are searched a window at a time
+    and scanned pages are released, so memory stays flat on large logs.
+    """
+    if isinstance(data, mmap.mmap):
+        yield from _iter_mapped_payload_spans(data)
+        return
+
+    pattern = PAYLOAD_TEXT_RE if isinstance(data, str) else PAYLOAD_BYTES_RE
+
+    for match in pattern.finditer(data):
+        yield _payload_span(match)
+
+
+def _payload_span(match):
+    prefix = match.group()[:PAYLOAD_PREFIX_LENGTH]
+
+    if not isinstance(prefix, str):
+        prefix = prefix.decode("ascii")
+
+    return match.start(), match.end() - match.start(), PAYLOAD_KINDS[prefix]
+
+
+def _iter_mapped_payload_spans(data):
+    overlap = PAYLOAD_PREFIX_LENGTH - 1
+    position = 0
+    released = 0
+
+    while position < len(data):
+        window_end = min(position + MMAP_SCAN_WINDOW, len(data))
+        prefix_match = PAYLOAD_PREFIX_BYTES_RE.search(data, position, window_end + overlap)
+
+        if prefix_match is None:
+            position = window_end
+        else:
+            match = PAYLOAD_BYTES_RE.match(data, prefix_match.start())
+            yield _payload_span(match)
+            position = match.end()
+
+        released = _release_mapped_pages(data, released, position)
+
+
+def _release_mapped_pages(data, start, end):
+    """
+    Drop pages in [start, end) from memory and return the new release mark.
+    """
+    end -= end % mmap.PAGESIZE
+
+    if end > start and hasattr(mmap, "MADV_DONTNEED"):
+        data.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+    return max(start, end)
+
+
+def unwrap_payload(text):
+    """
+    Join the first payload in `text` back into one line if it was wrapped,
+    e.g. when copied from a terminal or a MIME body.
+
+    Lines after the one holding the prefix are joined while they are as
+    wide as that line; the first shorter line, or one ending in padding, is
+    the last one joined.
+    """
+    match = PAYLOAD_TEXT_RE.search(text)
+
+    if match is None:
+        return text
+
+    width = match.end() - (text.rfind("\n", 0, match.start()) + 1)
+    parts = [text[: match.end()]]
+    position = match.end()
+
+    while not parts[-1].endswith("="):
+        line_match = WRAPPED_PAYLOAD_LINE_RE.match(text, position)
+
+        if line_match is None or not _is_line_end(text, line_match.end()):
+            break
+
+        line = line_match.group(1)
+        if len(line) > width:
+            break
+
+        parts.append(line)
+        position = line_match.end()
+
+        if len(line) < width:
+            break
+
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def _is_line_end(text, position):
+    return position == len(text) or text[position] in "\r\n"
+
+
+def extract_dbd_payload(data):
+    """
+    Return the first payload in the input, or the input if there is none.
+
+    Text input returns a str slice. Binary input returns a memoryview so
+    the payload is not copied.
+    """
+    if not data:
+        return data
+
+    span = next(iter_payload_spans(data), None)
+
+    if span is None:
+        return data
+
+    offset, length, _ = span
+    payload_end = offset + length
+
+    if isinstance(data, str):
+        return data[offset:payload_end]
+
+    return memoryview(data)[offset:payload_end]
+
+
+# ==================
+# Input Helpers
+# ==================
+
+
+def read_input_file(file_path, mmap_threshold=MMAP_THRESHOLD):
+    """
+    Return a file's contents as bytes, or as a read-only memory map if large.
+
+    Memory-mapped files are paged in only where they are read, so extracting
+    a payload from a large capture does not load the whole file.
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < mmap_threshold:
+            return f.read()
+
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def close_input_file(data):
+    """
+    Close a memory map returned by read_input_file; bytes need no cleanup.
+    """
+    if isinstance(data, mmap.mmap):
+        data.close()
+
+
+@contextmanager
+def open_input_file(file_path, mmap_threshold=MMAP_THRESHOLD):
+    """
+    Like read_input_file, but closes the memory map when the block exits.
+
+    Views into the data must be released before then. Views still held by
+    the frames of an exception raised in the block are dropped first, so
+    the map can be closed and the original error reaches the caller.
+    """
+    data = read_input_file(file_path, mmap_threshold)
+
+    try:
+        yield data
+    except BaseException as exc:
+        _clear_traceback_frames(exc)
+        raise
+    finally:
+        close_input_file(data)
+
+
+def _clear_traceback_frames(exc):
+    # Imported here; it is only needed once something has failed.
+    import traceback
+
+    seen = set()
+
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        traceback.clear_frames(exc.__traceback__)
+        exc = exc.__cause__ or exc.__context__
+
+
+# ==================
+# Output Helpers
+# ==================
+
+
+def build_output_path(subfolder, input_path=None, input_root=None):
+    """
+    Return the save path for a result under Output/<subfolder>.
+
+    Uses the input file name when available, otherwise a timestamp. With
+    `input_root`, the input's path below that folder is kept, so inputs
+    with the same name in different folders do not overwrite each other.
+    """
+    if input_path and input_root:
+        filename = os.path.relpath(os.path.abspath(input_path), input_root)
+    elif input_path:
+        filename = os.path.basename(input_path)
+    else:
+        filename = datetime.now().strftime("%Y-%m-%dT%H-%M-%S") + ".json"
+
+    save_path = os.path.join(os.getcwd(), OUTPUT_FOLDER, subfolder, filename)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+
+    return save_path
+
+
+def common_input_root(file_paths):
+    """
+    Return the deepest folder that contains every file, for use as the
+    `input_root` of build_output_path, or None if there is none.
+    """
+    try:
+        return os.path.commonpath(
+            [os.path.dirname(os.path.abspath(file_path)) for file_path in file_paths]
+        )
+    except ValueError:
+        # No paths, or paths on different drives.
+        return None
+
+
+def nested_map_path(file_path):
+    """
+    Return where the nested payload map for a saved output file lives.
+    """
+    return os.path.splitext(file_path)[0] + NESTED_MAP_SUFFIX
+
+
 # ==================
 # Access Key Helpers
 # ==================
@@ -43,6 +335,183 @@ def version_to_tuple(version):
     return tuple(int(part) for part in version.split("."))
 
 
+def parse_key_id(key_id):
+    """
+    Split a key ID such as "9.5.0_live" into ((9, 5, 0), "live").
+
+    Raises ValueError if the version part is not numeric.
+    """
+    version, _, branch = key_id.partition("_")
+    return version_to_tuple(version), branch
+
+
+# ==================
+# Key Ring
+# ==================
+
+
+class UnknownKeyIdError(ValueError):
+    """
+    Raised when a payload or caller names a key ID that is not in the ring.
+    """
+
+    def __init__(self, message, key_id):
+        super().__init__(message)
+        self.key_id = key_id
+
+    def __reduce__(self):
+        # Keeps key_id when the error crosses a process pool.
+        return type(self), (str(self), self.key_id)
+
+
+class KeyRing(Mapping):
+    """
+    Read-only mapping of key ID -> access key, indexed by version and branch.
+
+    Each key ID is parsed once when the ring is built, and each access key
+    is decoded to AES key bytes at the same time. Branch, version and prefix
+    lookups use bisection over sorted indexes. To change the key set, build
+    a new ring and replace the reference; rings that are already shared are
+    never modified.
+    """
+
+    def __init__(self, access_keys=None):
+        entries = []
+
+        for key_id, access_key in (access_keys or {}).items():
+            try:
+                parsed = parse_key_id(key_id)
+            except ValueError:
+                parsed = ((0, 0, 0), key_id.partition("_")[2])
+            entries.append((key_id, access_key, parsed))
+
+        self._build(entries)
+
+    @classmethod
+    def from_parsed(cls, entries):
+        """
+        Build a ring from (key_id, access_key, (version, branch)) entries
+        whose key IDs the caller has already parsed.
+        """
+        key_ring = cls.__new__(cls)
+        key_ring._build(entries)
+        return key_ring
+
+    def _build(self, entries):
+        self._access_keys = {}
+        self._aes_keys = {}
+        self._parsed = {}
+        branches = {}
+
+        for key_id, access_key, (version, branch) in entries:
+            self._access_keys[key_id] = access_key
+            self._parsed[key_id] = (version, branch)
+            branches.setdefault(branch, []).append((version, key_id))
+
+            try:
+                self._aes_keys[key_id] = decode_access_key(access_key)
+            except (binascii.Error, ValueError):
+                # Reported when the key is used, not when the ring is built.
+                self._aes_keys[key_id] = None
+
+        self._branches = {branch: sorted(items) for branch, items in branches.items()}
+
+        by_version = sorted(
+            (version, key_id) for key_id, (version, _) in self._parsed.items()
+        )
+        self._versions = [version for version, _ in by_version]
+        self._version_key_ids = [key_id for _, key_id in by_version]
+        self._sorted_key_ids = sorted(self._access_keys)
+
+    # ----------------- Mapping -----------------
+
+    def __getitem__(self, key_id):
+        return self._access_keys[key_id]
+
+    def __iter__(self):
+        return iter(self._access_keys)
+
+    def __len__(self):
+        return len(self._access_keys)
+
+    def __contains__(self, key_id):
+        return key_id in self._access_keys
+
+    def get(self, key_id, default=None):
+        return self._access_keys.get(key_id, default)
+
+    # ----------------- Queries -----------------
+
+    def aes_key(self, key_id):
+        """
+        Return the decoded AES key for a key ID.
+
+        Raises KeyError for an unknown key ID and ValueError if its access
+        key is not valid base64.
+        """
+        aes_key = self._aes_keys[key_id]
+
+        if aes_key is None:
+            raise ValueError(f'Access key for "{key_id}" is not valid base64.')
+
+        return aes_key
+
+    def version(self, key_id):
+        return self._parsed[key_id][0]
+
+    def branch(self, key_id):
+        return self._parsed[key_id][1]
+
+    def latest(self, branch="live"):
+        """
+        Return the newest key ID for a branch, or None if there is none.
+        """
+        items = self._branches.get(branch)
+        return items[-1][1] if items else None
+
+    def for_branch(self, branch):
+        """
+        Return the key IDs of a branch, oldest version first.
+        """
+        return [key_id for _, key_id in self._branches.get(branch, ())]
+
+    def for_version(self, version):
+        """
+        Return the key IDs of every branch for a version such as "9.5.0".
+        """
+        if isinstance(version, str):
+            version = version_to_tuple(version)
+
+        start = bisect_left(self._versions, version)
+        end = bisect_right(self._versions, version, start)
+        return self._version_key_ids[start:end]
+
+    def with_prefix(self, prefix):
+        """
+        Return the key IDs that start with `prefix`, in sorted order.
+        """
+        key_ids = []
+        index = bisect_left(self._sorted_key_ids, prefix)
+
+        while index < len(self._sorted_key_ids):
+            key_id = self._sorted_key_ids[index]
+            if not key_id.startswith(prefix):
+                break
+            key_ids.append(key_id)
+            index += 1
+
+        return key_ids
+
+
+def as_key_ring(access_keys):
+    """
+    Return `access_keys` as a KeyRing, building one from a plain mapping.
+    """
+    if isinstance(access_keys, KeyRing):
+        return access_keys
+    return KeyRing(access_keys)
+
+
 # ==================
 # Access Key Parsing
 # ==================
@@ -50,12 +519,12 @@ def version_to_tuple(version):
 
 def parse_access_keys(response_text):
     """
-    Parse API response into a dictionary of access keys.
+    Parse API response into a KeyRing of access keys.
 
-    Filters out excluded prefixes and versions below MIN_VERSION.
-    Returns a mapping of key_id -> access_key.
+    Filters out excluded prefixes and versions below MIN_VERSION. Each key
+    ID is parsed once, here, and handed to the ring already parsed.
     """
-    access_keys = {}
+    entries = {}
 
     for line in response_text.splitlines():
         line = line.strip()
@@ -74,39 +543,296 @@ def parse_access_keys(response_text):
         if key_id.startswith(EXCLUDED_PREFIXES):
             continue
 
-        version = key_id.split("_", 1)[0]
-
         try:
-            if version_to_tuple(version) < MIN_VERSION:
-                continue
+            parsed = parse_key_id(key_id)
         except ValueError:
             continue
 
-        access_keys[key_id] = access_key
+        if parsed[0] < MIN_VERSION:
+            continue
 
-    return access_keys
+        entries[key_id] = (key_id, access_key, parsed)
+
+    return KeyRing.from_parsed(entries.values())
 
 
 # ==================
-# API Access
+# Key Cache
 # ==================
 
 
-def fetch_access_keys():
+def load_key_cache(cache_path=KEY_CACHE_PATH):
     """
-    Fetch access keys from the API and return parsed results.
+    Load the on-disk key cache.
 
-    Returns an empty dictionary if the request fails.
+    Returns None if the cache is missing or unreadable.
     """
     try:
-        response = requests.get(
-            KEY_API_URL,
-            timeout=REQUEST_TIMEOUT,
-        )
-        response.raise_for_status()
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(cache, dict) or not isinstance(cache.get("access_keys"), dict):
+        return None
 
+    return cache
+
+
+def save_key_cache(cache, cache_path=KEY_CACHE_PATH):
+    """
+    Write the key cache atomically so readers never see a partial file.
+    """
+    folder = os.path.dirname(cache_path) or "."
+    os.makedirs(folder, exist_ok=True)
+
+    file_descriptor, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(temp_path, cache_path)
+    except OSError as exc:
+        print(f"Failed to save access key cache: {exc}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def load_cached_access_keys(cache_path=KEY_CACHE_PATH):
+    cache = load_key_cache(cache_path)
+    return KeyRing(cache["access_keys"] if cache else None)
+
+
+# ==================
+# API Access
+# ==================
+
+
+def fetch_access_keys(url=KEY_API_URL, cache_path=KEY_CACHE_PATH):
+    """
+    Fetch access keys from the API and return them as a KeyRing.
+
+    Revalidates the on-disk cache with ETag/Last-Modified when one exists.
+    Falls back to the cached keys, or an empty ring if there are none, when
+    the request fails. Pass cache_path=None to skip the cache.
+    """
+    # Imported here so decryption-only callers never pay for requests.
+    import requests
+
+    try:
+        return download_access_keys(url, cache_path)
     except requests.RequestException as exc:
         print(f"Failed to fetch access keys: {exc}")
-        return {}
+        return load_cached_access_keys(cache_path) if cache_path else KeyRing()
+
+
+def download_access_keys(url=KEY_API_URL, cache_path=KEY_CACHE_PATH):
+    """
+    Like fetch_access_keys, but raises requests.RequestException instead of
+    falling back to the cached keys.
+    """
+    import requests
+
+    cache = load_key_cache(cache_path) if cache_path else None
+    headers = {}
+
+    if cache:
+        if cache.get("etag"):
+            headers["If-None-Match"] = cache["etag"]
+        if cache.get("last_modified"):
+            headers["If-Modified-Since"] = cache["last_modified"]
+
+    response = requests.get(
+        url,
+        headers=headers,
+        timeout=REQUEST_TIMEOUT,
+    )
+
+    if response.status_code == 304 and cache:
+        cache["fetched_at"] = time.time()
+        save_key_cache(cache, cache_path)
+        return KeyRing(cache["access_keys"])
+
+    response.raise_for_status()
+
+    access_keys = parse_access_keys(response.text)
+
+    if cache_path:
+        save_key_cache(
+            {
+                "fetched_at": time.time(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "access_keys": dict(access_keys),
+            },
+            cache_path,
+        )
 
-    return parse_access_keys(response.text)
+    return access_keys
+
+
+# ==================
+# Key Reload
+# ==================
+
+
+class KeyStore:
+    """
+    Holds the current KeyRing for a long-running session and replaces it
+    when the API publishes new keys.
+
+    `key_ring` is swapped by a single assignment, so a caller that reads it
+    once per operation always sees one complete key set. Listeners are
+    called with the new ring, on the refreshing thread, whenever a refresh
+    changes the keys.
+    """
+
+    def __init__(
+        self,
+        key_ring=None,
+        fetch=download_access_keys,
+        interval=KEY_REFRESH_INTERVAL,
+        retry=KEY_REFRESH_RETRY,
+        jitter=KEY_REFRESH_JITTER,
+        on_demand_interval=KEY_ON_DEMAND_REFRESH_INTERVAL,
+    ):
+        self.key_ring = as_key_ring(key_ring)
+        self.fetch = fetch
+        self.interval = interval
+        self.retry = retry
+        self.jitter = jitter
+        self.on_demand_interval = on_demand_interval
+
+        self.refreshes = 0
+        self.changes = 0
+        self.failures = 0
+        self.last_refresh = None
+        self.last_error = None
+
+        self._listeners = []
+        self._refresh_lock = threading.Lock()
+        self._last_on_demand = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def replace(self, key_ring):
+        """
+        Swap in keys loaded elsewhere, e.g. by a manual refresh. Listeners
+        are not called; the caller already has the new ring.
+        """
+        self.key_ring = as_key_ring(key_ring)
+
+    def refresh(self):
+        """
+        Fetch the keys now and return True if they changed.
+
+        Fetch errors propagate. An empty result never replaces a non-empty
+        ring.
+        """
+        with self._refresh_lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self):
+        key_ring = as_key_ring(self.fetch())
+
+        self.refreshes += 1
+        self.last_refresh = time.time()
+
+        if not key_ring or key_ring == self.key_ring:
+            return False
+
+        self.key_ring = key_ring
+        self.changes += 1
+
+        for listener in self._listeners:
+            listener(key_ring)
+
+        return True
+
+    def refresh_for_unknown(self, key_id):
+        """
+        Refresh because `key_id` was not found, and return True if it is
+        known afterwards.
+
+        At most one such refresh runs per `on_demand_interval`; concurrent
+        callers wait for it instead of starting their own.
+        """
+        with self._refresh_lock:
+            if key_id in self.key_ring:
+                return True
+
+            now = time.monotonic()
+            if (
+                self._last_on_demand is not None
+                and now - self._last_on_demand < self.on_demand_interval
+            ):
+                return False
+
+            self._last_on_demand = now
+
+            try:
+                self._refresh_locked()
+            except Exception as exc:
+                self._record_failure(exc)
+                return False
+
+            return key_id in self.key_ring
+
+    def start(self):
+        """
+        Refresh on a daemon thread every `interval` seconds until stop().
+        """
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="access-key-reload", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "key_ids": len(self.key_ring),
+            "refreshes": self.refreshes,
+            "changes": self.changes,
+            "failures": self.failures,
+            "last_refresh": self.last_refresh,
+            "last_error": self.last_error,
+        }
+
+    def _record_failure(self, exc):
+        self.failures += 1
+        self.last_error = str(exc)
+
+    def _run(self):
+        consecutive_failures = 0
+
+        while not self._stop.wait(self._next_delay(consecutive_failures)):
+            try:
+                self.refresh()
+            except Exception as exc:
+                consecutive_failures += 1
+                self._record_failure(exc)
+            else:
+                consecutive_failures = 0
+
+    def _next_delay(self, consecutive_failures):
+        if consecutive_failures:
+            delay = min(self.retry * 2 ** (consecutive_failures - 1), self.interval)
+        else:
+            delay = self.interval
+
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)